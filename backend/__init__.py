@@ -3,10 +3,13 @@ Backend package for the game launcher application.
 """
 __version__ = "0.1.0"
 
-# Import the main FastAPI app
-try:
-    from .main import app
-    __all__ = ["app"]
-except ImportError:
-    # If app is not available, keep the package minimal
-    pass
+__all__ = ["app"]
+
+
+def __getattr__(name):
+    # Import the FastAPI app lazily: backend.main scans the library on import,
+    # and lightweight submodules (metrics, bridge) should not pay for that.
+    if name == "app":
+        from .main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,44 @@
 """
 Entry point for running the backend application.
 Allows the package to be executed with `python -m backend`.
+
+Pass `--uds /path/to/socket` to serve over a Unix domain socket instead of
+TCP, which skips the loopback network stack for local clients.
+
+Pass `--workers N` to serve several clients at once. Workers share state
+through a SQLite store; one of them is elected leader and runs downloads,
+LAN sharing and library scans. The control API only answers loopback
+clients, whatever `--host` is bound to.
 """
+import argparse
 import sys
 import os
 
 def main():
     """Main entry point for the application."""
+    parser = argparse.ArgumentParser(prog="python -m backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--uds", default=None, help="serve on this Unix domain socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    # Lets the backend advertise the right port to LAN peers
+    os.environ.setdefault("UNCHAINED_PORT", str(args.port))
+    # Inherited by the worker processes
+    os.environ["UNCHAINED_WORKERS"] = str(args.workers)
+
     try:
-        from .main import app
         import uvicorn
-        uvicorn.run(app, host="127.0.0.1", port=8000)
+        if args.workers > 1:
+            # Workers import the app themselves, so it has to be passed by name
+            app = "backend.main:app"
+        else:
+            from .main import app
+        if args.uds:
+            uvicorn.run(app, uds=args.uds, workers=args.workers)
+        else:
+            uvicorn.run(app, host=args.host, port=args.port, workers=args.workers)
     except ImportError as e:
         print(f"Error importing from main.py: {e}")
         print("Make sure your main.py contains a FastAPI app instance named 'app'")
@@ -0,0 +1,84 @@
+"""
+Compare the cost of reaching the backend over each transport.
+
+    python -m backend.bench_transport [--iterations 500]
+
+Starts the app on loopback TCP and on a Unix domain socket, then times the
+same library and search calls over HTTP/TCP, HTTP/UDS and the in-process
+bridge. Searches use the "library" category so no upstream requests are made.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def start_server(app, **kwargs):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", **kwargs))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def http_caller(conn):
+    def call(method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=payload, headers=headers)
+        return json.loads(conn.getresponse().read())
+    return call
+
+
+def measure(label, func, iterations):
+    func()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} mean {statistics.mean(samples):8.3f} ms   p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m backend.bench_transport")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--query", default="a")
+    args = parser.parse_args()
+
+    from .main import UnixHTTPConnection, app
+    from .bridge import Bridge
+
+    uds_path = os.path.join(tempfile.mkdtemp(), "unchained.sock")
+    tcp_server = start_server(app, host="127.0.0.1", port=args.port)
+    uds_server = start_server(app, uds=uds_path)
+
+    tcp = http_caller(http.client.HTTPConnection("127.0.0.1", args.port))
+    uds = http_caller(UnixHTTPConnection(uds_path))
+    bridge = Bridge()
+    search_body = {"query": args.query, "category": "library"}
+
+    print(f"{args.iterations} iterations per transport\n")
+    for name, call in (("tcp", tcp), ("uds", uds)):
+        measure(f"library  http/{name}", lambda: call("GET", "/api/library"), args.iterations)
+    measure("library  bridge", bridge.list_games, args.iterations)
+    print()
+    for name, call in (("tcp", tcp), ("uds", uds)):
+        measure(f"search   http/{name}", lambda: call("POST", "/api/search", search_body), args.iterations)
+    measure("search   bridge", lambda: bridge.search_games(args.query, "library"), args.iterations)
+
+    tcp_server.should_exit = True
+    uds_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+In-process transport between the pywebview window and the backend.
+
+An instance of `Bridge` is passed to pywebview as `js_api`, so the frontend
+can call `window.pywebview.api.<method>()` and reach the same functions that
+back the FastAPI routes without going through TCP, HTTP parsing or CORS.
+"""
+import time
+
+from . import metrics
+
+
+class Bridge:
+    """JS API object exposed to the webview. Public methods mirror the /api routes."""
+
+    def _call(self, method: str, func, *args):
+        # Imported lazily so constructing the bridge does not trigger the library scan
+        from fastapi.encoders import jsonable_encoder
+
+        start = time.perf_counter()
+        try:
+            return jsonable_encoder(func(*args))
+        finally:
+            metrics.observe("unchained_bridge_call_seconds", time.perf_counter() - start, method=method)
+
+    def list_games(self):
+        from .main import GameInfo, list_games
+        # Validate through the response model so the payload matches GET /api/library exactly
+        return self._call("list_games", lambda: [GameInfo.model_validate(g) for g in list_games()])
+
+    def search_games(self, query=None, category="all", limit=None):
+        from .main import SearchRequest, search_games
+        # Leave limit unset unless given, so the model default applies exactly as over HTTP
+        request = SearchRequest(query=query, category=category, **({"limit": limit} if limit is not None else {}))
+        return self._call("search_games", search_games, request)
+
+    def get_igdb_game_metadata(self, game_id):
+        from .main import get_igdb_game_metadata
+        return self._call("get_igdb_game_metadata", get_igdb_game_metadata, int(game_id))
+
+    def launch_game(self, game_id):
+        from .main import launch_game
+        return self._call("launch_game", launch_game, int(game_id))
+
+    def refresh_games(self):
+        from .main import refresh_games
+        return self._call("refresh_games", refresh_games)
+
+
+metrics.describe("unchained_bridge_call_seconds", "histogram", "Duration of in-process bridge calls by method")
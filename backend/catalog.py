@@ -0,0 +1,312 @@
+"""
+Local mirror of the Flathub catalog with an in-memory search index.
+
+The Flathub appstream file (every app's id, name, summary, categories,
+keywords and icon) is fetched with a conditional GET, so an unchanged
+catalog costs one 304. A changed catalog is stored as served (gzip) and
+parsed incrementally with iterparse; only apps that were added, changed or
+removed touch the index. The parsed catalog is saved as `catalog.json.gz`,
+so searches work offline and across restarts.
+
+The index maps lowercase tokens to apps with per-field weights. Query
+tokens are matched as prefixes against a sorted token list; if that finds
+too little, rapidfuzz ranks app names to catch typos. Apps reported by
+`flatpak list` are flagged as installed.
+"""
+import bisect
+import gzip
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import requests
+from rapidfuzz import fuzz, process
+
+from . import metrics
+
+APPSTREAM_URL = os.getenv("UNCHAINED_FLATHUB_APPSTREAM_URL") or "https://dl.flathub.org/repo/appstream/x86_64/appstream.xml.gz"
+ICON_URL = "https://dl.flathub.org/repo/appstream/x86_64/icons/128x128/{}"
+REQUEST_TIMEOUT = (10, 60)  # connect, read
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+# Field weights used when ranking token matches
+FIELD_WEIGHTS = {"name": 8, "id": 4, "keywords": 2, "categories": 2, "developer": 1, "summary": 1}
+FUZZY_CUTOFF = 75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+def _text(element, tag):
+    """Untranslated text of a child element"""
+    for child in element.findall(tag):
+        if child.get(XML_LANG) is None:
+            return (child.text or "").strip()
+    return None
+
+
+def parse_component(component) -> dict:
+    icon = None
+    for node in component.findall("icon"):
+        if node.get("type") == "remote":
+            icon = (node.text or "").strip()
+            break
+        if node.get("type") == "cached" and node.get("width", "128") == "128" and not icon:
+            icon = ICON_URL.format((node.text or "").strip())
+    releases = [int(r.get("timestamp")) for r in component.findall("releases/release") if r.get("timestamp")]
+    return {
+        "app_id": _text(component, "id"),
+        "name": _text(component, "name"),
+        "summary": _text(component, "summary"),
+        "developer": _text(component, "developer_name") or _text(component, "developer/name"),
+        "categories": [c.text for c in component.findall("categories/category") if c.text],
+        "keywords": [k.text for k in component.findall("keywords/keyword") if k.text and k.get(XML_LANG) is None],
+        "icon": icon,
+        "license": _text(component, "project_license"),
+        "released": max(releases) if releases else None,
+    }
+
+
+def parse_appstream(fileobj):
+    """Yield app records from a (decompressed) appstream XML stream"""
+    for _event, element in ET.iterparse(fileobj, events=("end",)):
+        if element.tag != "component":
+            continue
+        if element.get("type") in ("desktop-application", "desktop", "console-application"):
+            record = parse_component(element)
+            if record["app_id"] and record["name"]:
+                yield record
+        element.clear()
+
+
+def list_installed():
+    """Apps installed with flatpak, keyed by application id; empty if flatpak is missing"""
+    try:
+        result = subprocess.run(
+            ["flatpak", "list", "--app", "--columns=application,name,version,size"],
+            capture_output=True, text=True, timeout=15,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    installed = {}
+    for line in result.stdout.splitlines():
+        fields = line.split("\t")
+        if fields and fields[0]:
+            fields += [""] * (4 - len(fields))
+            installed[fields[0]] = {"name": fields[1], "version": fields[2], "size": fields[3]}
+    return installed
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.records = {}
+        self.postings = {}  # token -> {app_id: weight}
+        self._tokens = []  # sorted, rebuilt after updates
+        self._names = {}  # app id -> lowercase name, for fuzzy matching
+        self._dirty = False
+
+    def _fields(self, record):
+        yield "name", tokenize(record["name"])
+        yield "id", tokenize(record["app_id"].replace(".", " "))
+        yield "keywords", [t for k in record["keywords"] for t in tokenize(k)]
+        yield "categories", [t for c in record["categories"] for t in tokenize(c)]
+        yield "developer", tokenize(record["developer"])
+        yield "summary", tokenize(record["summary"])
+
+    def add(self, record):
+        app_id = record["app_id"]
+        if app_id in self.records:
+            self.remove(app_id)
+        self.records[app_id] = record
+        for field, tokens in self._fields(record):
+            for token in tokens:
+                weights = self.postings.setdefault(token, {})
+                weights[app_id] = max(weights.get(app_id, 0), FIELD_WEIGHTS[field])
+        self._dirty = True
+
+    def remove(self, app_id):
+        record = self.records.pop(app_id, None)
+        if record is None:
+            return
+        for _field, tokens in self._fields(record):
+            for token in tokens:
+                weights = self.postings.get(token)
+                if weights is not None:
+                    weights.pop(app_id, None)
+                    if not weights:
+                        del self.postings[token]
+        self._dirty = True
+
+    def _matching_tokens(self, prefix):
+        if self._dirty:
+            self._tokens = sorted(self.postings)
+            self._names = {app_id: record["name"].lower() for app_id, record in self.records.items()}
+            self._dirty = False
+        if len(prefix) < 2:
+            return [prefix] if prefix in self.postings else []
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + "\uffff")
+        return self._tokens[start:end]
+
+    def search(self, query: str, limit: int):
+        """App ids ranked by token-prefix matches, topped up with fuzzy name matches"""
+        scores = None
+        for query_token in tokenize(query):
+            token_scores = {}
+            for token in self._matching_tokens(query_token):
+                # Exact token matches beat prefix matches
+                bonus = 1.0 if token == query_token else 0.5
+                for app_id, weight in self.postings[token].items():
+                    token_scores[app_id] = max(token_scores.get(app_id, 0), weight * bonus)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {a: s + token_scores[a] for a, s in scores.items() if a in token_scores}
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], self.records[item[0]]["name"].lower()))
+        results = [app_id for app_id, _score in ranked[:limit]]
+        if len(results) < limit and len(query) >= 3:  # fuzzy scores on one or two letters are noise
+            for _name, _score, app_id in process.extract(
+                    query.lower(), self._names, scorer=fuzz.WRatio, processor=None,
+                    limit=limit, score_cutoff=FUZZY_CUTOFF):
+                if app_id not in results:
+                    results.append(app_id)
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+class FlathubCatalog:
+    def __init__(self, cache_dir, max_age=86400, client=None):
+        """client is anything with a requests-style get(), e.g. the shared UpstreamClient"""
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.catalog_path = self.cache_dir / "catalog.json.gz"
+        self.appstream_path = self.cache_dir / "appstream.xml.gz"
+        self.max_age = max_age
+        self.index = CatalogIndex()
+        self.installed = {}
+        self.lock = threading.RLock()
+        self.client = client or requests.Session()
+        self.state = {"etag": None, "last_modified": None, "checked": 0, "updated": 0}
+        self.loaded = threading.Event()
+
+    def load(self):
+        """Rebuild the index from the catalog saved by the last refresh (also used to reload it)"""
+        with metrics.span("catalog_load"):
+            if self.catalog_path.exists():
+                try:
+                    with gzip.open(self.catalog_path, "rt", encoding="utf-8") as f:
+                        saved = json.load(f)
+                    index = CatalogIndex()
+                    for record in saved["apps"]:
+                        index.add(record)
+                    with self.lock:
+                        self.state.update(saved["state"])
+                        self.index = index
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[FLATHUB] Ignoring damaged catalog: {e}")
+            self.refresh_installed()
+        self.loaded.set()
+
+    def _save(self):
+        with self.lock:
+            saved = {"state": self.state, "apps": list(self.index.records.values())}
+        tmp_path = self.catalog_path.with_name(self.catalog_path.name + ".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(saved, f, separators=(",", ":"))
+        os.replace(tmp_path, self.catalog_path)
+
+    def stale(self) -> bool:
+        return time.time() - self.state["checked"] > self.max_age
+
+    def refresh(self, force=False):
+        """Fetch the appstream file if it changed and apply the differences to the index"""
+        if not force and not self.stale():
+            return False
+        headers = {}
+        if self.state["etag"] and self.appstream_path.exists():
+            headers["If-None-Match"] = self.state["etag"]
+        if self.state["last_modified"] and self.appstream_path.exists():
+            headers["If-Modified-Since"] = self.state["last_modified"]
+        with metrics.span("flathub_request"):
+            resp = self.client.get(APPSTREAM_URL, headers=headers, stream=True, timeout=REQUEST_TIMEOUT)
+        if resp.status_code == 304:
+            resp.close()
+            self.state["checked"] = time.time()
+            self._save()
+            return False
+        resp.raise_for_status()
+
+        tmp_path = self.appstream_path.with_name(self.appstream_path.name + ".part")
+        resp.raw.decode_content = True  # undo any transfer compression; the file itself stays gzip
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(resp.raw, f, 1024 * 1024)  # stored as served, still gzip-compressed
+        metrics.inc("unchained_download_bytes_total", tmp_path.stat().st_size, source="flathub")
+        os.replace(tmp_path, self.appstream_path)
+
+        with gzip.open(self.appstream_path, "rb") as f:
+            fresh = {record["app_id"]: record for record in parse_appstream(f)}
+        with self.lock:
+            changed = [r for app_id, r in fresh.items() if self.index.records.get(app_id) != r]
+            removed = [app_id for app_id in self.index.records if app_id not in fresh]
+            for record in changed:
+                self.index.add(record)
+            for app_id in removed:
+                self.index.remove(app_id)
+            self.state.update(
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                checked=time.time(),
+                updated=time.time(),
+            )
+        metrics.inc("unchained_catalog_apps_changed_total", len(changed) + len(removed))
+        self._save()
+        print(f"[FLATHUB] Catalog updated: {len(changed)} changed, {len(removed)} removed, {len(fresh)} apps")
+        return True
+
+    def refresh_installed(self):
+        installed = list_installed()
+        with self.lock:
+            self.installed = installed
+
+    def search(self, query: str, limit: int):
+        with metrics.span("catalog_search"), self.lock:
+            return [self.index.records[app_id] for app_id in self.index.search(query, limit)]
+
+    def installed_apps(self, query=None):
+        """Installed flatpaks, with catalog details where the app is known"""
+        query_lower = (query or "").lower()
+        apps = []
+        with self.lock:
+            for app_id, info in self.installed.items():
+                record = self.index.records.get(app_id) or {
+                    "app_id": app_id, "name": info["name"] or app_id, "summary": None, "developer": None,
+                    "categories": [], "keywords": [], "icon": None, "license": None, "released": None,
+                }
+                if query_lower and query_lower not in record["name"].lower() and query_lower not in app_id.lower():
+                    continue
+                apps.append(record)
+        return apps
+
+    def status(self):
+        with self.lock:
+            return {
+                **self.state,
+                "loaded": self.loaded.is_set(),
+                "apps": len(self.index.records),
+                "tokens": len(self.index.postings),
+                "installed": len(self.installed),
+                "stale": self.stale(),
+            }
+
+
+metrics.describe("unchained_catalog_apps_changed_total", "counter", "Flathub apps added, changed or removed by catalog refreshes")
@@ -0,0 +1,469 @@
+"""
+Segmented, resumable download manager.
+
+Each download is split into fixed-size chunks fetched in parallel with HTTP
+range requests, spread across all of its mirror URIs and sharing one pooled
+requests session. Chunks are written with pwrite() straight into a
+preallocated `<name>.part` file, which is renamed into place when complete,
+so there is no copy at the end. Which chunks are done is persisted as a
+bitmap next to the file, so a crash or restart resumes where it stopped.
+
+A checksum, if given, is verified while data arrives: the hash advances over
+the contiguous prefix of finished chunks, reading them back from the page
+cache, so by the time the last chunk lands the digest is almost complete.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+CHUNK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 64 * 1024
+REQUEST_TIMEOUT = (10, 30)  # connect, read
+
+
+class TokenBucket:
+    """Blocking rate limiter; a rate of 0 means unlimited"""
+
+    def __init__(self, bytes_per_second: float = 0):
+        self.rate = bytes_per_second
+        self.tokens = bytes_per_second
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, num_bytes: int):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= num_bytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _pack_bitmap(bits: bytearray) -> str:
+    packed = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            packed[i // 8] |= 1 << (i % 8)
+    return base64.b64encode(bytes(packed)).decode("ascii")
+
+
+def _unpack_bitmap(data: str, length: int) -> bytearray:
+    packed = base64.b64decode(data)
+    return bytearray((packed[i // 8] >> (i % 8)) & 1 for i in range(length))
+
+
+def _new_hasher(checksum):
+    if not checksum:
+        return None
+    algorithm = checksum.split(":", 1)[0] if ":" in checksum else "sha256"
+    return hashlib.new(algorithm)
+
+
+class Download:
+    def __init__(self, id, title, uris, path, checksum=None, max_bytes_per_second=0):
+        self.id = id
+        self.title = title
+        self.uris = list(uris)
+        self.path = Path(path)
+        self.checksum = checksum
+        self.max_bytes_per_second = max_bytes_per_second or 0
+        self.size = None
+        self.ranges = False
+        self.chunk_size = CHUNK_SIZE
+        self.bitmap = bytearray()
+        self.status = "queued"
+        self.error = None
+
+        self.bucket = TokenBucket(self.max_bytes_per_second)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.changed = threading.Condition()  # notified whenever more data lands or the status changes
+        self.hasher = None
+        self.hashed_chunks = 0
+        self.bytes_done = 0
+        self.started_at = None
+
+    @property
+    def part_path(self):
+        return self.path.with_name(self.path.name + ".part")
+
+    @property
+    def num_chunks(self):
+        return len(self.bitmap)
+
+    def available_bytes(self):
+        """Length of the prefix of the .part file that is completely written"""
+        with self.lock:
+            if self.status == "completed":
+                return self.size  # bytes_done is not persisted, so a reloaded download goes by its size
+            if not self.ranges:
+                return self.bytes_done
+            done = 0
+            while done < len(self.bitmap) and self.bitmap[done]:
+                done += 1
+        return min(self.size, done * self.chunk_size)
+
+    def notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def chunk_range(self, index):
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size) - 1
+
+    def to_state(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "uris": self.uris,
+            "path": str(self.path),
+            "checksum": self.checksum,
+            "max_bytes_per_second": self.max_bytes_per_second,
+            "size": self.size,
+            "ranges": self.ranges,
+            "chunk_size": self.chunk_size,
+            "bitmap": _pack_bitmap(self.bitmap),
+            "num_chunks": len(self.bitmap),
+            "status": self.status,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        download = cls(state["id"], state["title"], state["uris"], state["path"],
+                       state.get("checksum"), state.get("max_bytes_per_second"))
+        download.size = state.get("size")
+        download.ranges = state.get("ranges", False)
+        download.chunk_size = state.get("chunk_size", CHUNK_SIZE)
+        download.bitmap = _unpack_bitmap(state.get("bitmap", ""), state.get("num_chunks", 0))
+        download.status = state.get("status", "queued")
+        download.error = state.get("error")
+        return download
+
+    def progress(self):
+        done = sum(self.bitmap)
+        if self.status == "completed":
+            done_bytes = self.size
+        elif self.size:
+            done_bytes = min(self.size, done * self.chunk_size) if self.ranges else self.bytes_done
+        else:
+            done_bytes = self.bytes_done
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "id": self.id,
+            "title": self.title,
+            "path": str(self.path),
+            "status": self.status,
+            "error": self.error,
+            "size": self.size,
+            "downloaded": done_bytes,
+            "progress": done_bytes / self.size if self.size else None,
+            "chunks_done": done,
+            "chunks_total": self.num_chunks,
+            "bytes_per_second": self.bytes_done / elapsed if elapsed > 0 else 0,
+        }
+
+
+class DownloadManager:
+    def __init__(self, directory, max_bytes_per_second=0, limit=lambda kind: 4):
+        """limit(kind) returns the current limit for "downloads" (active at once) and "connections" (per download)"""
+        self.directory = Path(directory)
+        self.state_dir = self.directory / ".state"
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.limit = limit
+        self.global_bucket = TokenBucket(max_bytes_per_second)
+        self.on_complete = []  # callbacks taking the finished Download
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._downloads = {}
+        self._active = set()
+
+    # -------------------- Public API --------------------
+    def add(self, uris, title=None, filename=None, checksum=None, max_bytes_per_second=0):
+        if not uris:
+            raise ValueError("At least one URI is required")
+        if not filename:
+            filename = unquote(Path(urlparse(uris[0]).path).name) or f"{uuid.uuid4().hex}.bin"
+        filename = Path(filename).name  # never escape the downloads directory
+        download_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            path = self._unique_path(self.directory / filename, download_id)
+            download = Download(download_id, title or filename, uris, path, checksum, max_bytes_per_second)
+            self._downloads[download.id] = download
+        self._save(download)
+        self._schedule()
+        return download
+
+    def _unique_path(self, path, download_id):
+        """path, or path tagged with the download id if another download or file already claims it"""
+        taken = {d.path for d in self._downloads.values()}
+        if path in taken or path.exists() or path.with_name(path.name + ".part").exists():
+            path = path.with_name(f"{path.stem}-{download_id}{path.suffix}")
+        return path
+
+    def get(self, download_id):
+        return self._downloads.get(download_id)
+
+    def list(self):
+        return [d.progress() for d in self._downloads.values()]
+
+    def pause(self, download_id):
+        download = self._downloads[download_id]
+        if download.status in ("queued", "downloading"):
+            download.status = "paused"
+            download.stop_event.set()
+            self._save(download)
+
+    def resume(self, download_id):
+        download = self._downloads[download_id]
+        if download.status in ("paused", "failed"):
+            download.status = "queued"
+            download.error = None
+            self._save(download)
+            self._schedule()
+
+    def cancel(self, download_id):
+        download = self._downloads[download_id]
+        download.status = "cancelled"
+        download.stop_event.set()
+        self._save(download)
+        with self._lock:
+            if download.id not in self._active:
+                self._discard(download)
+
+    def load(self):
+        """Pick up downloads persisted by a previous run and resume unfinished ones"""
+        for state_path in self.state_dir.glob("*.json"):
+            try:
+                download = Download.from_state(json.loads(state_path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[DOWNLOADS] Skipping unreadable state {state_path.name}: {e}")
+                continue
+            if download.status == "downloading":
+                download.status = "queued"
+            self._downloads[download.id] = download
+        self._schedule()
+
+    # -------------------- Scheduling --------------------
+    def _schedule(self):
+        with self._lock:
+            for download in self._downloads.values():
+                if len(self._active) >= self.limit("downloads"):
+                    return
+                if download.status == "queued" and download.id not in self._active:
+                    self._active.add(download.id)
+                    download.stop_event.clear()
+                    threading.Thread(target=self._run, args=(download,), name=f"download-{download.id}", daemon=True).start()
+
+    def _run(self, download):
+        try:
+            download.status = "downloading"
+            download.started_at = time.monotonic()
+            download.bytes_done = 0
+            self._save(download)
+            with metrics.span("download"):
+                if download.size is None:
+                    self._probe(download)
+                if download.ranges:
+                    self._download_ranges(download)
+                else:
+                    self._download_stream(download)
+            if download.stop_event.is_set():
+                return
+            self._finish(download)
+        except Exception as e:
+            if not download.stop_event.is_set():
+                download.status = "failed"
+                download.error = str(e)
+                print(f"[DOWNLOADS] {download.title} failed: {e}")
+        finally:
+            self._save(download)
+            with self._lock:
+                self._active.discard(download.id)
+                if download.status == "cancelled":
+                    self._discard(download)
+            download.notify()
+            self._schedule()
+
+    def _probe(self, download):
+        """Find the size and whether the first reachable mirror supports range requests"""
+        last_error = None
+        for uri in download.uris:
+            try:
+                resp = self.session.head(uri, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+                resp.raise_for_status()
+            except requests.RequestException as e:
+                last_error = e
+                continue
+            length = resp.headers.get("Content-Length")
+            download.size = int(length) if length else None
+            download.ranges = bool(download.size) and resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+            num_chunks = (download.size + download.chunk_size - 1) // download.chunk_size if download.ranges else 1
+            download.bitmap = bytearray(num_chunks)
+            return
+        raise last_error or IOError("No URIs to probe")
+
+    def _open_part(self, download):
+        fd = os.open(download.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if download.size and os.fstat(fd).st_size != download.size:
+            # Reserve the whole file up front so chunks can land anywhere without fragmentation
+            try:
+                os.posix_fallocate(fd, 0, download.size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, download.size)
+        return fd
+
+    def _download_ranges(self, download):
+        fd = self._open_part(download)
+        try:
+            download.hasher = _new_hasher(download.checksum)
+            download.hashed_chunks = 0
+            self._advance_hash(download, fd)
+            missing = [i for i, done in enumerate(download.bitmap) if not done]
+            abort = threading.Event()  # one failed chunk fails the download, so stop the other workers
+
+            def fetch(index):
+                try:
+                    self._fetch_chunk(download, fd, index, abort)
+                except BaseException:
+                    abort.set()
+                    raise
+
+            with ThreadPoolExecutor(max_workers=max(1, self.limit("connections"))) as pool:
+                for future in [pool.submit(fetch, i) for i in missing]:
+                    future.result()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _fetch_chunk(self, download, fd, index, abort):
+        if download.stop_event.is_set() or abort.is_set():
+            return
+        start, end = download.chunk_range(index)
+        last_error = None
+        # Start each chunk on a different mirror, fall through to the others on failure
+        for attempt in range(len(download.uris)):
+            uri = download.uris[(index + attempt) % len(download.uris)]
+            try:
+                offset = start
+                with self.session.get(uri, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+                    if resp.status_code != 206:
+                        raise IOError(f"{uri} answered {resp.status_code} to a range request")
+                    for block in resp.iter_content(READ_SIZE):
+                        if download.stop_event.is_set() or abort.is_set():
+                            return
+                        self.global_bucket.consume(len(block))
+                        download.bucket.consume(len(block))
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                        download.bytes_done += len(block)
+                        metrics.inc("unchained_download_bytes_total", len(block), source="downloads")
+                if offset != end + 1:
+                    raise IOError(f"Short read from {uri}: got {offset - start} of {end + 1 - start} bytes")
+                with download.lock:
+                    download.bitmap[index] = 1
+                self._save(download)
+                self._advance_hash(download, fd)
+                download.notify()
+                return
+            except (requests.RequestException, OSError) as e:
+                last_error = e
+        raise last_error
+
+    def _advance_hash(self, download, fd):
+        if download.hasher is None:
+            return
+        with download.lock:
+            while download.hashed_chunks < download.num_chunks and download.bitmap[download.hashed_chunks]:
+                start, end = download.chunk_range(download.hashed_chunks)
+                download.hasher.update(os.pread(fd, end + 1 - start, start))
+                download.hashed_chunks += 1
+
+    def _download_stream(self, download):
+        """Fallback for servers without range support: one sequential stream, restarted from zero"""
+        hasher = _new_hasher(download.checksum)
+        last_error = None
+        for uri in download.uris:
+            try:
+                download.bytes_done = 0
+                # Unbuffered so readers following the file (the streaming installer) see every block
+                with self.session.get(uri, stream=True, timeout=REQUEST_TIMEOUT) as resp, open(download.part_path, "wb", buffering=0) as f:
+                    resp.raise_for_status()
+                    for block in resp.iter_content(READ_SIZE):
+                        if download.stop_event.is_set():
+                            return
+                        self.global_bucket.consume(len(block))
+                        download.bucket.consume(len(block))
+                        f.write(block)
+                        if hasher:
+                            hasher.update(block)
+                        download.bytes_done += len(block)
+                        metrics.inc("unchained_download_bytes_total", len(block), source="downloads")
+                        download.notify()
+                    f.flush()
+                    os.fsync(f.fileno())
+                download.size = download.bytes_done
+                download.bitmap = bytearray([1])
+                download.hasher = hasher
+                download.hashed_chunks = 1
+                return
+            except (requests.RequestException, OSError) as e:
+                last_error = e
+        raise last_error or IOError("No URIs to download")
+
+    def _finish(self, download):
+        if download.hasher is not None:
+            expected = download.checksum.split(":", 1)[-1].lower()
+            actual = download.hasher.hexdigest()
+            if actual != expected:
+                # The data is unusable; start over on the next resume
+                download.bitmap = bytearray(download.num_chunks)
+                raise IOError(f"Checksum mismatch: expected {expected}, got {actual}")
+        os.replace(download.part_path, download.path)
+        download.status = "completed"
+        print(f"[DOWNLOADS] Finished {download.title} -> {download.path}")
+        for callback in self.on_complete:
+            try:
+                callback(download)
+            except Exception as e:
+                print(f"[DOWNLOADS] Completion hook failed for {download.title}: {e}")
+
+    # -------------------- Persistence --------------------
+    def _state_path(self, download):
+        return self.state_dir / f"{download.id}.json"
+
+    def _save(self, download):
+        with download.save_lock:
+            with download.lock:
+                state = download.to_state()
+            path = self._state_path(download)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(state), encoding="utf-8")
+            os.replace(tmp_path, path)
+
+    def _discard(self, download):
+        self._downloads.pop(download.id, None)
+        self._state_path(download).unlink(missing_ok=True)
+        download.part_path.unlink(missing_ok=True)
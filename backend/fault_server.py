@@ -0,0 +1,144 @@
+"""
+Local stand-in for upstream services that injects faults.
+
+    python -m backend.fault_server [--port 18600] [--latency-ms 50] [--jitter-ms 0]
+        [--slow-rate 0.05] [--slow-ms 2000] [--error-rate 0.1]
+        [--rate-limit-rate 0.1] [--hang-rate 0.01] [--reset-rate 0.01]
+
+POST /games answers like the IGDB proxy (a short list of games) and any GET
+returns a small PNG, so the backend can be pointed at it with
+
+    UNCHAINED_IGDB_URL=http://127.0.0.1:18600/games python -m backend
+
+Each request independently draws one fault: a slow answer, a 503, a 429
+with Retry-After, a hang that never answers, or a dropped connection.
+GET /_stats returns counts of what was served.
+"""
+import argparse
+import base64
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+GAMES = [
+    {
+        "id": 1000 + i,
+        "name": f"Fault Test Game {i}",
+        "rating": 70 + i,
+        "cover": {"url": "//images.igdb.com/igdb/image/upload/t_thumb/fault.jpg"},
+        "genres": [{"name": "Adventure"}],
+        "platforms": [{"name": "PC (Microsoft Windows)"}],
+        "summary": "Served by the fault server.",
+    }
+    for i in range(5)
+]
+
+
+def make_handler(options, stats, lock):
+    class FaultHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _count(self, outcome):
+            with lock:
+                stats[outcome] = stats.get(outcome, 0) + 1
+
+        def _send(self, status, body: bytes, content_type, headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _fault(self) -> bool:
+            """Apply a random fault; returns True if the request has been dealt with"""
+            roll = random.random()
+            for outcome, rate in (("hang", options.hang_rate), ("reset", options.reset_rate),
+                                  ("error", options.error_rate), ("rate_limited", options.rate_limit_rate),
+                                  ("slow", options.slow_rate)):
+                if roll < rate:
+                    break
+                roll -= rate
+            else:
+                outcome = "ok"
+            delay = (options.latency_ms + random.uniform(0, options.jitter_ms)) / 1000
+            if outcome == "slow":
+                delay += options.slow_ms / 1000
+            time.sleep(delay)
+            self._count(outcome)
+            if outcome == "hang":
+                time.sleep(3600)
+                return True
+            if outcome == "reset":
+                # SO_LINGER with a zero timeout makes close() send a RST
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                self.close_connection = True
+                return True
+            if outcome == "error":
+                self._send(503, b'{"message":"injected failure"}', "application/json")
+                return True
+            if outcome == "rate_limited":
+                self._send(429, b'{"message":"slow down"}', "application/json", [("Retry-After", "1")])
+                return True
+            return False
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self._fault():
+                self._send(200, json.dumps(GAMES).encode("utf-8"), "application/json")
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                with lock:
+                    body = json.dumps(stats).encode("utf-8")
+                self._send(200, body, "application/json")
+                return
+            if not self._fault():
+                self._send(200, PNG, "image/png")
+
+    return FaultHandler
+
+
+def parse_options(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.fault_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18600)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.1)
+    parser.add_argument("--hang-rate", type=float, default=0.01)
+    parser.add_argument("--reset-rate", type=float, default=0.01)
+    return parser.parse_args(argv)
+
+
+def make_server(options, stats=None):
+    """A server for options (port 0 picks a free one); the options can be changed while it runs"""
+    server = ThreadingHTTPServer((options.host, options.port),
+                                 make_handler(options, {} if stats is None else stats, threading.Lock()))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    options = parse_options()
+    server = make_server(options)
+    print(f"Fault server on http://{options.host}:{options.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Resource governor: keeps the launcher out of the way while a game is running.
+
+Games started by launch_game() are supervised here. While any of them is
+alive the governor reports `game_active()`, non-urgent work passed to
+`defer()` is held until the last game exits, work passed to
+`background_call()` runs on a worker thread with idle CPU and I/O priority
+(SCHED_IDLE, nice 19, ioprio class idle), and `limit()` hands out lower
+concurrency limits.
+"""
+import ctypes
+import os
+import platform
+import queue
+import threading
+
+from . import metrics
+
+NORMAL_LIMITS = {"downloads": 4, "connections": 8, "hashing": 4, "scanning": 4}
+GAMING_LIMITS = {"downloads": 1, "connections": 2, "hashing": 1, "scanning": 1}
+
+# ioprio_set(2) syscall numbers; not exposed by the os module
+_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "armv7l": 314, "i686": 289}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def lower_current_thread_priority():
+    """Best-effort: move the calling thread to idle CPU and I/O scheduling (Linux only)"""
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        pass
+    syscall_nr = _IOPRIO_SET.get(platform.machine())
+    if syscall_nr is not None:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.syscall(syscall_nr, _IOPRIO_WHO_PROCESS, tid, _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT)
+        except (AttributeError, OSError):
+            pass
+
+
+class Governor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._games = {}  # game id -> Popen
+        self._deferred = {}  # key -> func, run once no game is active
+        self._idle_jobs = queue.Queue()
+        self._idle_thread = None
+        self.stats = {"deferred": 0, "deferred_run": 0, "idle_calls": 0}
+
+    # -------------------- Game supervision --------------------
+    def supervise(self, game_id: int, process):
+        """Track a launched game until its process exits"""
+        with self._lock:
+            self._games[game_id] = process
+        print(f"[GOVERNOR] Game {game_id} running, background work throttled")
+        threading.Thread(target=self._wait_for_exit, args=(game_id, process), daemon=True).start()
+
+    def _wait_for_exit(self, game_id, process):
+        process.wait()
+        with self._lock:
+            if self._games.get(game_id) is process:
+                del self._games[game_id]
+            still_active = bool(self._games)
+        if not still_active:
+            print("[GOVERNOR] No game running, resuming background work")
+            self._run_deferred()
+
+    def game_active(self) -> bool:
+        with self._lock:
+            return bool(self._games)
+
+    def running_games(self):
+        with self._lock:
+            return list(self._games)
+
+    # -------------------- Background work --------------------
+    def limit(self, kind: str) -> int:
+        """Concurrency limit for a kind of background work under the current mode"""
+        limits = GAMING_LIMITS if self.game_active() else NORMAL_LIMITS
+        return limits.get(kind, 1)
+
+    def defer(self, key: str, func) -> bool:
+        """Run func now, or hold it until gameplay ends. Returns True if it was deferred."""
+        with self._lock:
+            if self._games:
+                if key not in self._deferred:
+                    self._deferred[key] = func
+                    self.stats["deferred"] += 1
+                    metrics.inc("unchained_governor_deferred_total")
+                return True
+        func()
+        return False
+
+    def _run_deferred(self):
+        while True:
+            with self._lock:
+                if self._games or not self._deferred:
+                    return
+                key, func = next(iter(self._deferred.items()))
+                del self._deferred[key]
+            try:
+                func()
+                self.stats["deferred_run"] += 1
+            except Exception as e:
+                print(f"[GOVERNOR] Deferred job {key} failed: {e}")
+
+    def background_call(self, func, *args, **kwargs):
+        """Call func, on the idle-priority worker if a game is running"""
+        if not self.game_active():
+            return func(*args, **kwargs)
+        self._ensure_idle_thread()
+        done = threading.Event()
+        outcome = {}
+        self._idle_jobs.put((func, args, kwargs, outcome, done))
+        done.wait()
+        self.stats["idle_calls"] += 1
+        metrics.inc("unchained_governor_idle_calls_total")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _ensure_idle_thread(self):
+        with self._lock:
+            if self._idle_thread is None:
+                self._idle_thread = threading.Thread(target=self._idle_worker, name="unchained-idle", daemon=True)
+                self._idle_thread.start()
+
+    def _idle_worker(self):
+        # Priority is only ever lowered, never raised again, so this thread is dedicated to idle work
+        lower_current_thread_priority()
+        while True:
+            func, args, kwargs, outcome, done = self._idle_jobs.get()
+            try:
+                outcome["result"] = func(*args, **kwargs)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+    def status(self):
+        with self._lock:
+            return {
+                "game_active": bool(self._games),
+                "running_games": list(self._games),
+                "deferred_pending": len(self._deferred),
+                **self.stats,
+                "limits": GAMING_LIMITS if self._games else NORMAL_LIMITS,
+            }
+
+
+metrics.describe("unchained_governor_deferred_total", "counter", "Non-urgent jobs deferred because a game was running")
+metrics.describe("unchained_governor_idle_calls_total", "counter", "Calls run at idle priority because a game was running")
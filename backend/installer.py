@@ -0,0 +1,465 @@
+"""
+Streaming installer: extracts a game archive into the library while it downloads.
+
+Tar archives (plain, gz, bz2, xz) and zip archives are unpacked from a
+reader that follows the contiguous written prefix of the download's .part
+file, so extraction runs alongside the download and the data is only
+written to disk once more. Zip members that cannot be streamed (stored
+entries with a trailing data descriptor, encryption) and 7z archives fall
+back to extracting once the download has finished.
+
+Files land in a staging directory next to DATA_DIR. A manifest (file list,
+size, exes) is kept up to date as they land, and when extraction finishes
+the game directory is renamed into DATA_DIR in one step and, if it has an
+.exe at the top level, reported to `on_installed` so it can join the library
+without a rescan.
+
+Pending installs are recorded next to the download state, so after a
+restart `load()` attaches them to their resumed downloads again. An install
+waits while its download is paused or failed, and carries on (or starts
+over, if the download had to restart from zero) once it is resumed.
+"""
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+
+from . import metrics
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_SUFFIXES = (".zip",)
+SEVENZIP_SUFFIXES = (".7z",)
+MANIFEST_NAME = ".unchained-install.json"
+
+
+class NotStreamable(Exception):
+    """The archive needs random access; extract it after the download completes"""
+
+
+class DownloadRestarted(IOError):
+    """The download went back to zero, so extraction has to start over"""
+
+
+def archive_format(filename: str):
+    name = filename.lower()
+    if name.endswith(TAR_SUFFIXES):
+        return "tar"
+    if name.endswith(ZIP_SUFFIXES):
+        return "zip"
+    if name.endswith(SEVENZIP_SUFFIXES):
+        return "7z"
+    return None
+
+
+def safe_member_path(root: Path, name: str) -> Path:
+    """Resolve an archive member name inside root, refusing absolute paths and .. components"""
+    parts = PurePosixPath(name.replace("\\", "/")).parts
+    if not parts or parts[0] == "/" or ".." in parts:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return root.joinpath(*parts)
+
+
+class DownloadFollower(io.RawIOBase):
+    """Sequential reader over a download that blocks until the next bytes have been written"""
+
+    def __init__(self, download):
+        self.download = download
+        self.pos = 0
+        self.file = None
+
+    def readable(self):
+        return True
+
+    def _open(self):
+        with self.download.changed:
+            while self.file is None:
+                for path in (self.download.part_path, self.download.path):
+                    try:
+                        self.file = open(path, "rb")
+                        break
+                    except FileNotFoundError:
+                        pass
+                else:
+                    self._check_alive()
+                    self.download.changed.wait(timeout=0.5)
+
+    def _check_alive(self):
+        # A paused or failed download can still be resumed, so only cancellation ends the wait
+        if self.download.status == "cancelled":
+            raise IOError("Download cancelled")
+
+    def readinto(self, buffer):
+        if self.file is None:
+            self._open()
+        with self.download.changed:
+            while True:
+                available = self.download.available_bytes()
+                if available < self.pos:
+                    raise DownloadRestarted("Download restarted from the beginning")
+                if available > self.pos:
+                    break
+                if self.download.status == "completed":
+                    return 0  # EOF
+                self._check_alive()
+                self.download.changed.wait(timeout=0.5)
+        want = min(len(buffer), available - self.pos)
+        data = os.pread(self.file.fileno(), want, self.pos)
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        super().close()
+
+
+class PushbackReader:
+    """Exact-length reads with the ability to push unused bytes back"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.pending = b""
+
+    def read(self, size):
+        chunks = [self.pending[:size]]
+        self.pending = self.pending[size:]
+        got = len(chunks[0])
+        while got < size:
+            data = self.raw.read(min(size - got, 1024 * 1024))
+            if not data:
+                break
+            chunks.append(data)
+            got += len(data)
+        return b"".join(chunks)
+
+    def read_exact(self, size):
+        data = self.read(size)
+        if len(data) != size:
+            raise IOError("Unexpected end of archive")
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+class Install:
+    def __init__(self, id, name, download, staging_dir):
+        self.id = id
+        self.name = name
+        self.download = download
+        self.staging_dir = Path(staging_dir)
+        self.status = "waiting"
+        self.error = None
+        self.files = 0
+        self.size_bytes = 0
+        self.exes = []
+        self.streamed = False
+        self.path = None
+        self._last_manifest_write = 0.0
+
+    def file_landed(self, path: Path, size: int):
+        self.files += 1
+        self.size_bytes += size
+        relative = path.relative_to(self.staging_dir)
+        if path.suffix.lower() == ".exe":
+            self.exes.append(str(relative))
+        if time.monotonic() - self._last_manifest_write > 1.0:
+            self.write_manifest()
+
+    def write_manifest(self):
+        self._last_manifest_write = time.monotonic()
+        manifest_path = self.staging_dir / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        os.replace(tmp_path, manifest_path)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "download_id": self.download.id,
+            "status": self.status,
+            "error": self.error,
+            "download_status": self.download.status,
+            "streamed": self.streamed,
+            "files": self.files,
+            "size_bytes": self.size_bytes,
+            "exes": self.exes,
+            "path": str(self.path) if self.path else None,
+        }
+
+
+class Installer:
+    def __init__(self, staging_dir, data_dir, state_dir, on_installed=lambda install: None, keep_archives=False):
+        """state_dir holds one small file per pending install, normally inside the download state directory"""
+        self.staging_dir = Path(staging_dir)
+        self.data_dir = Path(data_dir)
+        self.state_dir = Path(state_dir)
+        self.on_installed = on_installed
+        self.keep_archives = keep_archives
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._installs = {}
+
+    def start(self, download, name=None):
+        """Install a download as it arrives. Returns None if the file is not a supported archive."""
+        if archive_format(download.path.name) is None:
+            return None
+        name = Path(name or download.title).name
+        for suffix in TAR_SUFFIXES + ZIP_SUFFIXES + SEVENZIP_SUFFIXES:
+            if name.lower().endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+        install = Install(download.id, name, download, self.staging_dir / download.id)
+        self._installs[install.id] = install
+        self._save(install)
+        threading.Thread(target=self._run, args=(install,), name=f"install-{install.id}", daemon=True).start()
+        return install
+
+    def load(self, get_download):
+        """Re-attach installs pending from a previous run; call after the download manager has loaded"""
+        for state_path in self.state_dir.glob("*.json"):
+            try:
+                state = json.loads(state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                print(f"[INSTALL] Skipping unreadable state {state_path.name}: {e}")
+                continue
+            download = get_download(state.get("download_id"))
+            if download is None or download.status == "cancelled":
+                state_path.unlink(missing_ok=True)
+                continue
+            print(f"[INSTALL] Resuming install of {state['name']}")
+            self.start(download, name=state["name"])
+
+    def _state_path(self, install):
+        return self.state_dir / f"{install.id}.json"
+
+    def _save(self, install):
+        path = self._state_path(install)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"name": install.name, "download_id": install.download.id}), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def get(self, install_id):
+        return self._installs.get(install_id)
+
+    def list(self):
+        return [install.to_dict() for install in self._installs.values()]
+
+    def _run(self, install):
+        kind = archive_format(install.download.path.name)
+        shutil.rmtree(install.staging_dir, ignore_errors=True)
+        install.staging_dir.mkdir(parents=True)
+        try:
+            install.status = "extracting"
+            with metrics.span("install", format=kind):
+                try:
+                    if kind == "7z":
+                        raise NotStreamable("7z archives need random access")
+                    install.streamed = True
+                    while True:
+                        try:
+                            with DownloadFollower(install.download) as raw:
+                                if kind == "tar":
+                                    self._extract_tar_stream(install, raw)
+                                else:
+                                    self._extract_zip_stream(install, PushbackReader(raw))
+                            break
+                        except DownloadRestarted:
+                            print(f"[INSTALL] {install.name}: download restarted, extracting again")
+                            self._reset_staging(install)
+                except NotStreamable as e:
+                    print(f"[INSTALL] {install.name}: {e}, extracting after download")
+                    install.streamed = False
+                    self._reset_staging(install)
+                    self._wait_for_download(install)
+                    self._extract_complete(install, kind)
+            # Extraction can finish before trailing bytes arrive; only install verified downloads
+            install.status = "verifying"
+            self._wait_for_download(install)
+            self._move_into_library(install)
+        except Exception as e:
+            install.status = "failed"
+            install.error = str(e)
+            print(f"[INSTALL] {install.name} failed: {e}")
+            if install.staging_dir.exists():
+                install.write_manifest()
+            self._state_path(install).unlink(missing_ok=True)
+            return
+        # The game is in DATA_DIR now; whatever fails from here on, a rescan still finds it
+        self._state_path(install).unlink(missing_ok=True)
+        try:
+            if not self.keep_archives:
+                install.download.path.unlink(missing_ok=True)
+            if install.exes:
+                self.on_installed(install)
+        except Exception as e:
+            print(f"[INSTALL] {install.name} installed, but adding it to the library failed: {e}")
+
+    def _reset_staging(self, install):
+        shutil.rmtree(install.staging_dir, ignore_errors=True)
+        install.staging_dir.mkdir(parents=True)
+        install.files = 0
+        install.size_bytes = 0
+        install.exes = []
+
+    def _wait_for_download(self, install):
+        """Block until the download completes; paused and failed downloads may still be resumed"""
+        download = install.download
+        with download.changed:
+            while download.status != "completed":
+                if download.status == "cancelled":
+                    raise IOError("Download cancelled")
+                download.changed.wait(timeout=1.0)
+
+    def _extract_tar_stream(self, install, raw):
+        buffered = io.BufferedReader(raw, buffer_size=1024 * 1024)
+        with tarfile.open(fileobj=buffered, mode="r|*") as tar:
+            for member in tar:
+                target = safe_member_path(install.staging_dir, member.name)
+                if hasattr(tarfile, "data_filter"):
+                    tar.extract(member, install.staging_dir, filter="data")
+                else:
+                    if not (member.isfile() or member.isdir()):
+                        continue
+                    tar.extract(member, install.staging_dir)
+                if member.isfile():
+                    install.file_landed(target, member.size)
+
+    def _extract_zip_stream(self, install, reader):
+        """Walk zip local file headers in order; the central directory at the end is not needed"""
+        entries = 0
+        while True:
+            signature = reader.read(4)
+            if signature in (b"PK\x01\x02", b"PK\x05\x06"):  # central directory or end of archive
+                if not entries:
+                    raise IOError("Zip archive has no entries")
+                return
+            if len(signature) < 4:
+                raise IOError("Unexpected end of archive")
+            if signature != b"PK\x03\x04":
+                if not entries:
+                    # Not a zip from the first byte (e.g. a self-extractor stub); let zipfile decide
+                    raise NotStreamable("archive does not start with a zip entry")
+                raise IOError(f"Unexpected data after zip entry {entries}")
+            entries += 1
+            (_, flags, method, _, _, crc, compressed_size, size,
+             name_length, extra_length) = struct.unpack("<HHHHHIIIHH", reader.read_exact(26))
+            name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+            extra = reader.read_exact(extra_length)
+            zip64 = self._zip64_sizes(extra)
+            if zip64:
+                size, compressed_size = zip64[0], zip64[1]
+            has_descriptor = bool(flags & 0x8)
+            if flags & 0x1:
+                raise NotStreamable("encrypted zip entries")
+            if method not in (0, 8) or (method == 0 and has_descriptor):
+                raise NotStreamable(f"zip entry {name} cannot be streamed")
+
+            target = safe_member_path(install.staging_dir, name)
+            is_dir = name.endswith("/")
+            if is_dir:
+                target.mkdir(parents=True, exist_ok=True)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+            written, actual_crc = 0, 0
+            with io.BytesIO() if is_dir else open(target, "wb") as out:
+                if method == 0:
+                    remaining = compressed_size
+                    while remaining:
+                        data = reader.read_exact(min(remaining, 1024 * 1024))
+                        remaining -= len(data)
+                        out.write(data)
+                        actual_crc = zlib.crc32(data, actual_crc)
+                        written += len(data)
+                else:
+                    inflater = zlib.decompressobj(-15)
+                    while not inflater.eof:
+                        data = reader.read(1024 * 1024)
+                        if not data:
+                            raise IOError("Unexpected end of archive")
+                        output = inflater.decompress(data)
+                        out.write(output)
+                        actual_crc = zlib.crc32(output, actual_crc)
+                        written += len(output)
+                    reader.unread(inflater.unused_data)
+            if has_descriptor:
+                descriptor = reader.read_exact(4)
+                if descriptor == b"PK\x07\x08":
+                    descriptor = reader.read_exact(4)
+                crc = struct.unpack("<I", descriptor)[0]
+                reader.read_exact(16 if zip64 else 8)  # sizes, already known from the stream
+            if actual_crc != crc:
+                raise IOError(f"CRC mismatch for {name}")
+            if not is_dir:
+                install.file_landed(target, written)
+
+    @staticmethod
+    def _zip64_sizes(extra):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, length = struct.unpack_from("<HH", extra, offset)
+            if header_id == 0x0001 and length >= 16:
+                return struct.unpack_from("<QQ", extra, offset + 4)
+            offset += 4 + length
+        return None
+
+    def _extract_complete(self, install, kind):
+        archive = install.download.path
+        if kind == "zip":
+            with zipfile.ZipFile(archive) as zf:
+                if not zf.infolist():
+                    raise IOError("Zip archive has no entries")
+                for info in zf.infolist():
+                    target = safe_member_path(install.staging_dir, info.filename)
+                    zf.extract(info, install.staging_dir)
+                    if not info.is_dir():
+                        install.file_landed(target, info.file_size)
+            return
+        try:
+            import py7zr
+            with py7zr.SevenZipFile(archive) as archive_file:
+                archive_file.extractall(install.staging_dir)
+        except ImportError:
+            binary = shutil.which("7z") or shutil.which("7zz") or shutil.which("7za")
+            if not binary:
+                raise RuntimeError("Extracting .7z needs py7zr or the 7z command")
+            subprocess.run([binary, "x", "-y", f"-o{install.staging_dir}", str(archive)],
+                           check=True, stdout=subprocess.DEVNULL)
+        for path in install.staging_dir.rglob("*"):
+            if path.is_file() and path.name != MANIFEST_NAME:
+                install.file_landed(path, path.stat().st_size)
+
+    def _move_into_library(self, install):
+        # Most archives wrap the game in one top-level folder; install that folder itself
+        entries = [p for p in install.staging_dir.iterdir() if p.name != MANIFEST_NAME]
+        if not entries:
+            raise IOError("Archive contained no files")
+        root = entries[0] if len(entries) == 1 and entries[0].is_dir() else install.staging_dir
+        destination = self.data_dir / install.name
+        if destination.exists():
+            raise FileExistsError(f"{destination} already exists")
+
+        install.exes = [p.name for p in root.iterdir() if p.is_file() and p.suffix.lower() == ".exe"]
+        (install.staging_dir / MANIFEST_NAME).unlink(missing_ok=True)
+        os.rename(root, destination)  # staging lives next to DATA_DIR, so this is atomic
+        if root is not install.staging_dir:
+            shutil.rmtree(install.staging_dir, ignore_errors=True)
+
+        install.path = destination
+        if install.exes:
+            install.status = "installed"
+        else:
+            # The library only lists game directories with an .exe at the top level
+            install.status = "no_executable"
+            install.error = "Installed, but there is no .exe at the top level, so it is not in the library"
+        print(f"[INSTALL] Installed {install.name} -> {destination}")
@@ -0,0 +1,275 @@
+"""
+Persistent queue for long-running backend work.
+
+Scans, refreshes, manifest builds, catalog updates and game launches are
+enqueued as jobs instead of running inside the request that asked for
+them; the request returns the job and the client follows it through
+`/api/jobs`. Jobs live in the shared SQLite store, so every worker can read
+them and work that was queued or running when the process stopped is picked
+up again on the next start.
+
+A dispatcher thread starts queued jobs in priority order (lower first, then
+oldest) as long as their kind is under its concurrency limit, which can be
+a number or a callable such as the governor's `limit()`. Enqueueing a job
+whose kind and key match one that is already queued or running returns the
+existing job. Cancelling a queued job drops it; a running job is told
+through its context and stops at its next `check_cancelled()`. Every change
+is appended to an event log that the event stream replays from a sequence
+number.
+"""
+import json
+import threading
+import time
+import uuid
+
+from . import metrics
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+KEEP_EVENTS = 1000
+KEEP_FINISHED_JOBS = 500
+PROGRESS_INTERVAL = 0.5  # seconds between persisted progress updates of one job
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, kind TEXT NOT NULL, key TEXT NOT NULL, params TEXT NOT NULL,
+    priority INTEGER NOT NULL, status TEXT NOT NULL, progress TEXT, result TEXT, error TEXT,
+    created REAL NOT NULL, started REAL, finished REAL, attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created);
+CREATE TABLE IF NOT EXISTS job_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, type TEXT NOT NULL, data TEXT NOT NULL, time REAL NOT NULL
+);
+"""
+COLUMNS = ("id", "kind", "key", "params", "priority", "status", "progress", "result", "error",
+           "created", "started", "finished", "attempts")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by check_cancelled() once the job has been cancelled"""
+
+
+class JobContext:
+    """What a job handler gets: its parameters, a way to report progress and the cancel flag"""
+
+    def __init__(self, queue, job_id, kind, params):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.cancelled = threading.Event()
+        self._reported = 0.0
+
+    def progress(self, done, total=None, message=None):
+        now = time.monotonic()
+        if total is not None and done < total and now - self._reported < PROGRESS_INTERVAL:
+            return
+        self._reported = now
+        self.queue._update(self.id, "progress", progress={"done": done, "total": total, "message": message})
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled(self.id)
+
+
+def _row_to_dict(row):
+    job = dict(zip(COLUMNS, row))
+    for field in ("params", "progress", "result"):
+        job[field] = json.loads(job[field]) if job[field] is not None else None
+    return job
+
+
+class JobQueue:
+    def __init__(self, store, background_initializer=None, poll_interval=1.0):
+        """store is the SharedStore; background_initializer runs first on threads of background kinds"""
+        self.store = store
+        self.background_initializer = background_initializer
+        self.poll_interval = poll_interval
+        self._kinds = {}  # kind -> {"func", "limit", "priority", "background", "resume"}
+        self._running = {}  # job id -> JobContext
+        self._cond = threading.Condition()
+        self._thread = None
+        self.store.connect().executescript(SCHEMA)
+
+    def register(self, kind, func, limit=1, priority=10, background=False, resume=True):
+        """func(ctx) does the work and returns a JSON-serialisable result.
+
+        limit is the number of jobs of this kind that may run at once, or a
+        callable returning it. Background kinds run at idle priority. Jobs of
+        kinds with resume=False fail instead of restarting when they were
+        interrupted by a shutdown.
+        """
+        self._kinds[kind] = {"func": func, "limit": limit, "priority": priority, "background": background, "resume": resume}
+
+    # -------------------- Queue --------------------
+    def enqueue(self, kind, params=None, key=None, priority=None):
+        """Queue a job, or return the queued or running job with the same kind and key"""
+        spec = self._kinds[kind]
+        params = params or {}
+        key = key if key is not None else json.dumps(params, sort_keys=True)
+        priority = spec["priority"] if priority is None else priority
+        db = self.store.connect()
+        with self._cond:
+            existing = self._find_active(kind, key)
+            if existing is not None:
+                if existing["status"] == "queued" and priority < existing["priority"]:
+                    db.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, existing["id"]))
+                    existing["priority"] = priority
+                    self._cond.notify()
+                metrics.inc("unchained_jobs_deduplicated_total", kind=kind)
+                return existing
+            job_id = uuid.uuid4().hex[:12]
+            db.execute(
+                "INSERT INTO jobs (id, kind, key, params, priority, status, created) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, key, json.dumps(params), priority, time.time()),
+            )
+            self._event(job_id, "queued", {"kind": kind, "params": params, "priority": priority})
+            metrics.inc("unchained_jobs_total", kind=kind, status="queued")
+            self._cond.notify()
+        return self.get(job_id)
+
+    def _find_active(self, kind, key):
+        row = self.store.connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE kind = ? AND key = ? AND status IN {ACTIVE}", (kind, key)
+        ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if it does not exist"""
+        with self._cond:
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            ctx = self._running.get(job_id)
+            if ctx is not None:
+                ctx.cancelled.set()  # the job thread records the outcome when it stops
+                self._event(job_id, "cancelling", {})
+            else:
+                self._update(job_id, "cancelled", status="cancelled", finished=time.time())
+                metrics.inc("unchained_jobs_total", kind=job["kind"], status="cancelled")
+                self._cond.notify()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.store.connect().execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def list(self, kind=None, status=None, limit=100):
+        """Newest jobs first, optionally filtered by kind and status"""
+        where, args = [], []
+        if kind:
+            where.append("kind = ?")
+            args.append(kind)
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self.store.connect().execute(sql + " ORDER BY created DESC LIMIT ?", (*args, limit)).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def events(self, after=0, limit=500):
+        """Events with a sequence number above after, oldest first"""
+        rows = self.store.connect().execute(
+            "SELECT seq, job_id, type, data, time FROM job_events WHERE seq > ? ORDER BY seq LIMIT ?", (after, limit)
+        ).fetchall()
+        return [{"seq": seq, "job": job_id, "type": type_, "data": json.loads(data), "time": t}
+                for seq, job_id, type_, data, t in rows]
+
+    def last_event(self):
+        return self.store.connect().execute("SELECT COALESCE(MAX(seq), 0) FROM job_events").fetchone()[0]
+
+    # -------------------- Bookkeeping --------------------
+    def _event(self, job_id, type_, data):
+        db = self.store.connect()
+        seq = db.execute(
+            "INSERT INTO job_events (job_id, type, data, time) VALUES (?, ?, ?, ?) RETURNING seq",
+            (job_id, type_, json.dumps(data), time.time()),
+        ).fetchone()[0]
+        if seq % 100 == 0:
+            db.execute("DELETE FROM job_events WHERE seq <= ?", (seq - KEEP_EVENTS,))
+
+    def _update(self, job_id, event, **fields):
+        """Write fields of a job and log them as an event"""
+        stored = {k: json.dumps(v) if k in ("progress", "result") else v for k, v in fields.items()}
+        self.store.connect().execute(
+            f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in stored)} WHERE id = ?", (*stored.values(), job_id))
+        self._event(job_id, event, fields)
+
+    # -------------------- Dispatcher --------------------
+    def start(self):
+        """Resume interrupted jobs and start dispatching (only in the process that runs jobs)"""
+        if self._thread is not None:
+            return
+        db = self.store.connect()
+        for row in db.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE status = 'running'").fetchall():
+            job = _row_to_dict(row)
+            spec = self._kinds.get(job["kind"])
+            if spec is not None and spec["resume"]:
+                self._update(job["id"], "resumed", status="queued", started=None)
+            else:
+                self._update(job["id"], "failed", status="failed", error="Interrupted by a restart", finished=time.time())
+        db.execute(
+            f"DELETE FROM jobs WHERE status IN {FINISHED} AND id NOT IN "
+            f"(SELECT id FROM jobs WHERE status IN {FINISHED} ORDER BY finished DESC LIMIT ?)", (KEEP_FINISHED_JOBS,))
+        self._thread = threading.Thread(target=self._dispatch, name="unchained-jobs", daemon=True)
+        self._thread.start()
+
+    def _limit(self, kind):
+        limit = self._kinds[kind]["limit"]
+        return limit(kind) if callable(limit) else limit
+
+    def _dispatch(self):
+        db = self.store.connect()
+        while True:
+            with self._cond:
+                running = {}
+                for ctx in self._running.values():
+                    running[ctx.kind] = running.get(ctx.kind, 0) + 1
+                queued = db.execute(
+                    "SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY priority, created").fetchall()
+                for job_id, kind, params in queued:
+                    if kind not in self._kinds or running.get(kind, 0) >= self._limit(kind):
+                        continue
+                    running[kind] = running.get(kind, 0) + 1
+                    ctx = JobContext(self, job_id, kind, json.loads(params))
+                    self._running[job_id] = ctx
+                    db.execute("UPDATE jobs SET attempts = attempts + 1 WHERE id = ?", (job_id,))
+                    self._update(job_id, "started", status="running", started=time.time())
+                    threading.Thread(target=self._run, args=(ctx,), name=f"job-{kind}-{job_id}", daemon=True).start()
+                # Limits can change without a notify (e.g. a game starts), so look again periodically
+                self._cond.wait(self.poll_interval)
+
+    def _run(self, ctx):
+        spec = self._kinds[ctx.kind]
+        if spec["background"] and self.background_initializer is not None:
+            self.background_initializer()
+        started = time.perf_counter()
+        try:
+            result = spec["func"](ctx)
+        except JobCancelled:
+            status, fields = "cancelled", {}
+        except Exception as e:
+            print(f"[JOBS] {ctx.kind} job {ctx.id} failed: {e}")
+            status, fields = "failed", {"error": str(e)}
+        else:
+            status, fields = ("cancelled", {}) if ctx.cancelled.is_set() else ("done", {"result": result})
+        metrics.observe("unchained_job_seconds", time.perf_counter() - started, kind=ctx.kind, status=status)
+        metrics.inc("unchained_jobs_total", kind=ctx.kind, status=status)
+        with self._cond:
+            self._update(ctx.id, status, status=status, finished=time.time(), **fields)
+            del self._running[ctx.id]
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            running = [{"id": ctx.id, "kind": ctx.kind} for ctx in self._running.values()]
+        counts = dict(self.store.connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"dispatching": self._thread is not None, "running": running, "counts": counts,
+                "limits": {kind: self._limit(kind) for kind in self._kinds}}
+
+
+metrics.describe("unchained_jobs_total", "counter", "Jobs queued and finished by kind and status")
+metrics.describe("unchained_jobs_deduplicated_total", "counter", "Enqueues answered with an already queued or running job")
+metrics.describe("unchained_job_seconds", "histogram", "Run time of jobs by kind and outcome")
@@ -0,0 +1,314 @@
+"""
+Multiple library roots, scanned in parallel per storage device.
+
+Games can live in several directories (internal SSD, SD card, NAS mount...).
+Roots are grouped by the device they sit on (`st_dev`) and each group is
+scanned by its own worker, so a slow SD card or network mount never holds up
+the fast disk; roots on the same device are scanned one after another to
+avoid seek thrashing. Every root has its own timeout. A root whose directory
+is gone, whose mount point is no longer mounted, or that does not answer in
+time keeps its previous games, marked unavailable, instead of disappearing
+from the library.
+
+Roots are stored in `libraries.json`; the first root is always the built-in
+data directory, which is where downloads and peer transfers install to.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import metrics
+
+DEFAULT_TIMEOUT = 30.0
+PROBE_TIMEOUT = 5.0
+
+
+class ScanTimeout(Exception):
+    pass
+
+
+def find_mount_point(path: Path) -> Path:
+    path = path.resolve()
+    while not os.path.ismount(path) and path.parent != path:
+        path = path.parent
+    return path
+
+
+class LibraryRoot:
+    def __init__(self, name: str, path, timeout: float = DEFAULT_TIMEOUT, mount_point=None, builtin=False, saved=True):
+        self.name = name
+        self.path = Path(path).expanduser()
+        self.timeout = timeout
+        # Recorded when the root is added, so an unmounted card or share is
+        # told apart from the empty directory left behind
+        self.mount_point = Path(mount_point) if mount_point else None
+        self.builtin = builtin
+        self.saved = saved  # False for roots given on the command line or environment
+        self.status = "unknown"  # online, offline, unmounted, timeout, error
+        self.device = None
+        self.error = None
+        self.games = []
+        self.scanned_at = None
+        self.scan_seconds = None
+
+    def config(self):
+        return {
+            "name": self.name,
+            "path": str(self.path),
+            "timeout": self.timeout,
+            "mount_point": str(self.mount_point) if self.mount_point else None,
+        }
+
+    def to_dict(self):
+        return {
+            **self.config(),
+            "builtin": self.builtin,
+            "saved": self.saved,
+            "status": self.status,
+            "device": self.device,
+            "error": self.error,
+            "games": len(self.games),
+            "scanned_at": self.scanned_at,
+            "scan_seconds": self.scan_seconds,
+        }
+
+
+def _call_with_timeout(fn, timeout):
+    """Run fn on a daemon thread; raise ScanTimeout if it has not returned in time.
+
+    Used for stat() calls that can hang indefinitely on a dead network mount.
+    """
+    result = {}
+
+    def run():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, name="unchained-probe", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ScanTimeout(f"no answer within {timeout:g}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+class LibraryRoots:
+    def __init__(self, config_path, default_path, extra_paths=(), limit=lambda kind: 4):
+        """default_path is always the first root; extra_paths are added for this run only.
+
+        limit("scanning") caps how many device groups are scanned at once.
+        """
+        self.config_path = Path(config_path)
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.roots = [LibraryRoot("default", default_path, builtin=True)]
+        self._last_known = None  # games from before this process scanned, see seed()
+        self._seeded = set()  # names of roots that have taken their games from it
+        self.load()
+        for path in extra_paths:
+            if path and not self.find(path=path):
+                self.roots.append(LibraryRoot(self._unique_name(Path(path).name), path, saved=False))
+
+    def load(self):
+        if not self.config_path.exists():
+            return
+        try:
+            config = json.loads(self.config_path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            print(f"[LIBRARY] Ignoring unreadable {self.config_path}: {e}")
+            return
+        for entry in config.get("roots", []):
+            if entry.get("name") == "default":
+                self.roots[0].timeout = entry.get("timeout", DEFAULT_TIMEOUT)
+                continue
+            self.roots.append(LibraryRoot(
+                entry["name"], entry["path"], entry.get("timeout", DEFAULT_TIMEOUT), entry.get("mount_point")))
+
+    def save(self):
+        config = {"roots": [root.config() for root in self.roots
+                            if root.saved and (not root.builtin or root.timeout != DEFAULT_TIMEOUT)]}
+        tmp_path = self.config_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.config_path)
+
+    def _unique_name(self, name):
+        base, n = name or "library", 1
+        while self.find(name=name):
+            n += 1
+            name = f"{base}-{n}"
+        return name
+
+    def find(self, name=None, path=None):
+        for root in self.roots:
+            if (name is not None and root.name == name) or (path is not None and root.path == Path(path).expanduser()):
+                return root
+        return None
+
+    def add(self, path, name=None, timeout=DEFAULT_TIMEOUT):
+        path = Path(path).expanduser()
+        if not path.is_dir():
+            raise ValueError(f"{path} is not a directory")
+        with self.lock:
+            if self.find(path=path):
+                raise ValueError(f"{path} is already a library root")
+            root = LibraryRoot(self._unique_name(name or path.name), path, timeout, find_mount_point(path))
+            self.roots.append(root)
+            self.save()
+        return root
+
+    def remove(self, name):
+        with self.lock:
+            root = self.find(name=name)
+            if root is None:
+                return None
+            if root.builtin:
+                raise ValueError("The default library cannot be removed")
+            self.roots.remove(root)
+            self.save()
+        return root
+
+    def _probe(self, root: LibraryRoot):
+        """Return the root's st_dev, or set its status and return None if it is unusable"""
+        def check():
+            if root.mount_point and not os.path.ismount(root.mount_point):
+                return "unmounted"
+            if not root.path.is_dir():
+                return "offline"
+            return os.stat(root.path).st_dev
+
+        try:
+            result = _call_with_timeout(check, min(root.timeout, PROBE_TIMEOUT))
+        except ScanTimeout as e:
+            root.status, root.error = "timeout", str(e)
+            return None
+        except OSError as e:
+            root.status, root.error = "offline", str(e)
+            return None
+        if isinstance(result, str):
+            root.status, root.error = result, None
+            return None
+        root.device = result
+        return result
+
+    def seed(self, games):
+        """Remember the last known library (e.g. the snapshot served at startup).
+
+        A root that this process has not scanned yet takes its games from
+        here, so if it is offline on the first scan its games stay in the
+        library, marked unavailable. Resolved lazily on the next scan so a
+        warm start does not decode every game up front.
+        """
+        self._last_known = games
+
+    def _apply_seed(self, root):
+        if root.name in self._seeded or root.scanned_at is not None or self._last_known is None:
+            return
+        self._seeded.add(root.name)
+        known = [dict(game) for game in self._last_known if game.get("library") == root.name]
+        names = {game["name"] for game in known}
+        # Keep games added since (e.g. a finished install) that the last known library lacks
+        root.games = known + [game for game in root.games if game["name"] not in names]
+
+    def scan(self, scan_root):
+        """Scan every root with scan_root(path, deadline) and return the merged game list.
+
+        scan_root should raise ScanTimeout once time.monotonic() passes deadline.
+        Roots that cannot be scanned keep the games found last time.
+        """
+        with self.lock:
+            roots = list(self.roots)
+        for root in roots:
+            self._apply_seed(root)
+
+        # Probed all at once, so dead mounts cost one probe timeout in total rather than one each
+        with ThreadPoolExecutor(max_workers=len(roots), thread_name_prefix="unchained-probe") as pool:
+            devices = list(pool.map(self._probe, roots))
+        groups = {}
+        for root, device in zip(roots, devices):
+            if device is not None:
+                groups.setdefault(device, []).append(root)
+
+        pending = deque(groups.values())
+        running = []  # (thread, group, hard deadline)
+        finished = threading.Condition()
+
+        def scan_group(group):
+            for root in group:
+                started = time.monotonic()
+                try:
+                    games = scan_root(root.path, started + root.timeout)
+                    status, error = "online", None
+                except ScanTimeout:
+                    games, status, error = None, "timeout", f"scan took longer than {root.timeout:g}s"
+                except OSError as e:
+                    games, status, error = None, "error", str(e)
+                with finished:
+                    if root.status == "abandoned":
+                        return
+                    if games is not None:
+                        root.games = games
+                        root.scanned_at = time.time()
+                    root.status, root.error = status, error
+                    root.scan_seconds = time.monotonic() - started
+                    finished.notify_all()
+                metrics.observe("unchained_library_scan_seconds", root.scan_seconds, root=root.name, status=status)
+
+        with finished:
+            while pending or running:
+                while pending and len(running) < max(1, self.limit("scanning")):
+                    group = pending.popleft()
+                    for root in group:
+                        root.status = "scanning"
+                    thread = threading.Thread(target=scan_group, args=(group,), name="unchained-scan", daemon=True)
+                    # A worker stuck in a hung syscall is given up on after the group's total budget
+                    running.append((thread, group, time.monotonic() + sum(r.timeout for r in group) + PROBE_TIMEOUT))
+                    thread.start()
+                finished.wait(timeout=max(0.0, min(deadline for _, _, deadline in running) - time.monotonic()))
+                now = time.monotonic()
+                for entry in list(running):
+                    thread, group, deadline = entry
+                    if not thread.is_alive():
+                        running.remove(entry)
+                    elif now >= deadline:
+                        for root in group:
+                            if root.status == "scanning":
+                                root.status = "abandoned"  # the worker discards whatever it returns
+                        running.remove(entry)
+            for root in roots:
+                if root.status == "abandoned":
+                    root.status, root.error = "timeout", "not responding"
+
+        return self.merge(roots)
+
+    def merge(self, roots):
+        """Combine root results in root order; the first root with a given game name wins.
+
+        Roots that were not scanned successfully contribute their last known
+        games, marked unavailable, rather than dropping them.
+
+        Game names key the metadata, saves and prefix directories, so a second
+        copy of a game elsewhere would share them and is left out.
+        """
+        games, seen = [], set()
+        for root in roots:
+            available = root.status == "online"
+            for game in root.games:
+                if game["name"] in seen:
+                    continue
+                seen.add(game["name"])
+                games.append({**game, "id": len(games), "library": root.name, "available": available})
+        return games
+
+    def to_list(self):
+        return [root.to_dict() for root in self.roots]
+
+
+metrics.describe("unchained_library_scan_seconds", "histogram", "Time to scan one library root")
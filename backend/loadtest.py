@@ -0,0 +1,142 @@
+"""
+Measure how /api/library and /api/search throughput scales with workers.
+
+    python -m backend.loadtest [--workers 1 2 4] [--games 500] [--clients 16] [--duration 10]
+
+Builds a synthetic library in a temporary directory, then for each worker
+count starts `python -m backend --workers N` on it and hammers both
+endpoints from several client processes over keep-alive connections.
+Searches use the "library" category so no upstream requests are made.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ENDPOINTS = {
+    "library": ("GET", "/api/library", None),
+    "search": ("POST", "/api/search", json.dumps({"query": "game 1", "category": "library"})),
+}
+
+
+def make_library(base_dir: Path, games: int):
+    for i in range(games):
+        name = f"Load Test Game {i}"
+        (base_dir / "data" / name).mkdir(parents=True)
+        (base_dir / "data" / name / "game.exe").touch()
+        (base_dir / "metadata" / name).mkdir(parents=True)
+        (base_dir / "metadata" / name / "metadata.json").write_text(json.dumps({
+            "id": i, "name": name, "genres": ["Action"], "platforms": ["PC (Microsoft Windows)"],
+            "first_release_date": 1500000000, "summary": "A game. " * 20,
+            "cover": f"/metadata/{name}/cover.jpg", "big": f"/metadata/{name}/big.jpg",
+            "screenshots": [], "artworks": [], "logos": [], "steam_id": None,
+        }), encoding="utf-8")
+
+
+def client(args):
+    port, endpoint, deadline = args
+    method, path, body = ENDPOINTS[endpoint]
+    headers = {"Content-Type": "application/json"} if body else {}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies, errors
+
+
+def wait_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/library")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("backend did not start")
+
+
+def run(workers, port, base_dir, clients, duration):
+    env = {
+        **os.environ,
+        "UNCHAINED_BASE_DIR": str(base_dir),
+        # Keep the catalog refresh from reaching the network during the run
+        "UNCHAINED_FLATHUB_APPSTREAM_URL": "http://127.0.0.1:9/appstream.xml.gz",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "backend", "--workers", str(workers), "--port", str(port)],
+        cwd=Path(__file__).resolve().parent.parent, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        wait_ready(port)
+        time.sleep(1)  # let every worker finish importing
+        with multiprocessing.Pool(clients) as pool:
+            for endpoint in ENDPOINTS:
+                deadline = time.monotonic() + duration
+                outcomes = pool.map(client, [(port, endpoint, deadline)] * clients)
+                latencies = sorted(l for ls, _ in outcomes for l in ls)
+                errors = sum(e for _, e in outcomes)
+                results[endpoint] = {
+                    "rps": len(latencies) / duration,
+                    "p50": statistics.median(latencies) * 1000 if latencies else float("nan"),
+                    "p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan"),
+                    "errors": errors,
+                }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m backend.loadtest")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--games", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=18700)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="unchained-loadtest-") as tmp:
+        base_dir = Path(tmp)
+        make_library(base_dir, args.games)
+        print(f"{args.games} games, {args.clients} clients, {args.duration:g}s per endpoint, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'endpoint':>10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+        baseline = {}
+        for i, workers in enumerate(args.workers):
+            results = run(workers, args.port + i, base_dir, args.clients, args.duration)
+            for endpoint, r in results.items():
+                baseline.setdefault(endpoint, r["rps"])
+                scale = r["rps"] / baseline[endpoint] if baseline[endpoint] else float("nan")
+                print(f"{workers:>8} {endpoint:>10} {r['rps']:>10.1f} {r['p50']:>10.1f} {r['p99']:>10.1f} "
+                      f"{r['errors']:>8}  x{scale:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import os
 from fastapi.middleware.cors import CORSMiddleware
 
 #!/usr/bin/env python3
+import asyncio
+import http.client
+import ipaddress
 import os
+import platform
+import socket
 import subprocess
-from fastapi import FastAPI, HTTPException
+import threading
+from fastapi import FastAPI, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from pathlib import Path
@@ -15,19 +22,59 @@ import time
 import json
 from PIL import Image
 from io import BytesIO
+from . import metrics, prefetch, snapshot
+from .governor import Governor, lower_current_thread_priority
+from .downloads import DownloadManager
+from .installer import Installer
+from .peers import PeerNode
+from .manifests import ManifestStore
+from .libraries import LibraryRoots, ScanTimeout
+from .catalog import FlathubCatalog
+from .upstream import UpstreamClient
+from .store import LeaderLock, SharedStore
+from .jobs import JobQueue
 
 # -------------------- CONFIG --------------------
-BASE_DIR = Path.home() / "Games"
-DATA_DIR = BASE_DIR / "data"
+BASE_DIR = Path(os.getenv("UNCHAINED_BASE_DIR") or Path.home() / "Games")
+DATA_DIR = BASE_DIR / "data"  # default library root, downloads and peer transfers install here
 PREFIXES_DIR = BASE_DIR / "prefixes"
 SAVES_DIR = BASE_DIR / "saves"
 METADATA_DIR = BASE_DIR / "metadata"
+DOWNLOADS_DIR = BASE_DIR / "downloads"
+STAGING_DIR = BASE_DIR / "staging"  # must be on the same filesystem as DATA_DIR
 
 CACHE_DIR = BASE_DIR / "cache"
+IMAGE_CACHE_DIR = CACHE_DIR / "images"
 CACHE_TTL = 86400 # one day in seconds
 
+# Extra library roots for this run (os.pathsep-separated), on top of libraries.json
+EXTRA_LIBRARY_ROOTS = [p for p in os.getenv("UNCHAINED_LIBRARY_ROOTS", "").split(os.pathsep) if p]
+
+# Background prefetch budget
+PREFETCH_BYTES_PER_SECOND = float(os.getenv("UNCHAINED_PREFETCH_BPS", 2 * 1024 * 1024))
+PREFETCH_CPU_SHARE = float(os.getenv("UNCHAINED_PREFETCH_CPU", 0.25))
+
+# LAN sharing is opt-in; UNCHAINED_PORT is the port this server is reachable on
+PEERS_ENABLED = os.getenv("UNCHAINED_PEERS") == "1"
+HTTP_PORT = int(os.getenv("UNCHAINED_PORT", 8000))
+
+# Read rate for background manifest hashing, in bytes per second
+HASH_BYTES_PER_SECOND = float(os.getenv("UNCHAINED_HASH_BPS", 64 * 1024 * 1024))
+
+# Worker processes serving the API, set by `python -m backend --workers N`
+WORKERS = int(os.getenv("UNCHAINED_WORKERS", 1))
+# Followers forward leader-only endpoints to the leader worker on this socket
+LEADER_SOCKET = BASE_DIR / "leader.sock"
+
+# JSON list of bay download entries, fetched on /api/refresh when set
+DOWNLOAD_SOURCES_URL = os.getenv("UNCHAINED_DOWNLOAD_SOURCES_URL")
+
+# Global download bandwidth limit in bytes per second, 0 = unlimited
+DOWNLOAD_BYTES_PER_SECOND = float(os.getenv("UNCHAINED_DOWNLOAD_BPS", 0))
+
 import hashlib
 import json
+import sqlite3
 from pathlib import Path
 import time
 
@@ -35,33 +82,42 @@ def hash_key(key: str) -> str:
     """Generate a filename-safe hash from a string"""
     return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
+@metrics.timed("kv_get")
 def kv_get(key: str):
-    """Get cached data from local KV if not expired"""
-    file_path = CACHE_DIR / hash_key(key)
-    if not file_path.exists():
-        return None
+    """Get cached data from the shared KV cache if not expired"""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            entry = json.load(f)
-        if time.time() - entry["time"] > CACHE_TTL:
-            file_path.unlink(missing_ok=True)  # expired
-            return None
-        return entry["data"]
-    except Exception:
+        entry = state_store.cache_get(hash_key(key))
+    except sqlite3.Error:
+        entry = None
+    if entry is None:
+        metrics.inc("unchained_cache_misses_total", cache="kv")
+        return None
+    written, data = entry
+    if time.time() - written > CACHE_TTL:
+        state_store.cache_delete(hash_key(key))  # expired
+        metrics.inc("unchained_cache_misses_total", cache="kv")
         return None
+    metrics.inc("unchained_cache_hits_total", cache="kv")
+    return data
 
+@metrics.timed("kv_set")
 def kv_set(key: str, data):
-    """Store data in local KV cache"""
-    file_path = CACHE_DIR / hash_key(key)
-    entry = {"time": time.time(), "data": data}
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(entry, f)
+    """Store data in the shared KV cache"""
+    state_store.cache_set(hash_key(key), data)
 
 
 
-for d in [DATA_DIR, PREFIXES_DIR, SAVES_DIR, METADATA_DIR,CACHE_DIR]:
+for d in [DATA_DIR, PREFIXES_DIR, SAVES_DIR, METADATA_DIR,CACHE_DIR, IMAGE_CACHE_DIR, DOWNLOADS_DIR, STAGING_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
+# State shared between worker processes, and the lock that picks the one running background services
+state_store = SharedStore(BASE_DIR / "state.db")
+leader_lock = LeaderLock(BASE_DIR / "leader.lock")
+leader_lock.acquire()
+
+# Long-running work runs as persistent jobs; only the leader dispatches them
+job_queue = JobQueue(state_store, background_initializer=lower_current_thread_priority)
+
 app = FastAPI(title="Game Launcher API")
 # -------------------- CORS --------------------
 origins = [
@@ -78,14 +134,109 @@ app.add_middleware(
 
 IGDB_TOKEN = None
 IGDB_TOKEN_EXPIRES = 0
-IGDB_URL = "https://igdb-proxy.robertplawski8.workers.dev/games"
+IGDB_URL = os.getenv("UNCHAINED_IGDB_URL") or "https://igdb-proxy.robertplawski8.workers.dev/games"
+# Only needed when IGDB_URL points at IGDB itself; the default proxy authenticates for us
+IGDB_CLIENT_ID = os.getenv("IGDB_CLIENT_ID")
+IGDB_CLIENT_SECRET = os.getenv("IGDB_CLIENT_SECRET")
+TWITCH_TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+igdb_token_lock = threading.Lock()
+
+metrics.start_profiler(CACHE_DIR / "profile.folded")
+
+# Throttles background work while a launched game is running
+governor = Governor()
+
+# Pooled session, timeouts, retries and circuit breakers for every upstream call
+upstream_client = UpstreamClient()
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Time every request and label it by route template rather than raw path"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "static"
+    metrics.observe("unchained_http_request_seconds", time.perf_counter() - start, route=path, method=request.method)
+    metrics.inc("unchained_http_requests_total", route=path, method=request.method, status=response.status_code)
+    return response
+
+def get_igdb_token(force=False):
+    """Twitch app token for IGDB, refreshed shortly before it expires; None without credentials"""
+    global IGDB_TOKEN, IGDB_TOKEN_EXPIRES
+    if not (IGDB_CLIENT_ID and IGDB_CLIENT_SECRET):
+        return None
+    with igdb_token_lock:
+        if force or not IGDB_TOKEN or time.time() > IGDB_TOKEN_EXPIRES - 60:
+            resp = upstream_client.post(TWITCH_TOKEN_URL, host="twitch", idempotent=True, params={
+                "client_id": IGDB_CLIENT_ID,
+                "client_secret": IGDB_CLIENT_SECRET,
+                "grant_type": "client_credentials",
+            })
+            resp.raise_for_status()
+            token = resp.json()
+            IGDB_TOKEN = token["access_token"]
+            IGDB_TOKEN_EXPIRES = time.time() + token["expires_in"]
+        return IGDB_TOKEN
+
+def igdb_post(headers, data, hedge=False):
+    """POST a query to IGDB, recording latency and bytes; retries once with a fresh token on 401"""
+    headers = dict(headers)
+    token = get_igdb_token()
+    if token:
+        headers.update({"Client-ID": IGDB_CLIENT_ID, "Authorization": f"Bearer {token}"})
+    with metrics.span("igdb_request"):
+        # Queries are reads, so retrying and hedging them is safe
+        resp = upstream_client.post(IGDB_URL, headers=headers, data=data, host="igdb", idempotent=True,
+                                    hedge_after="auto" if hedge else None)
+        if resp.status_code == 401 and token:
+            headers["Authorization"] = f"Bearer {get_igdb_token(force=True)}"
+            resp = upstream_client.post(IGDB_URL, headers=headers, data=data, host="igdb", idempotent=True)
+    metrics.inc("unchained_download_bytes_total", len(resp.content), source="igdb")
+    prefetch.charge(len(resp.content))
+    return resp
+
+def download_image(url: str, path, timeout=None):
+    """Download an image and save it to path, recording latency and bytes"""
+    with metrics.span("image_download"):
+        resp = upstream_client.get(url, **({"timeout": timeout} if timeout else {}))
+    # After its retries the client hands back the last error response; never decode that as an image
+    resp.raise_for_status()
+    content = resp.content
+    metrics.inc("unchained_download_bytes_total", len(content), source="images")
+    prefetch.charge(len(content))
+    Image.open(BytesIO(content)).save(path)
+    metrics.inc("unchained_images_written_total")
+
+# Only IGDB artwork is proxied through the image cache
+IMAGE_PROXY_HOSTS = ("images.igdb.com",)
+
+def cache_remote_image(url: str) -> Path:
+    """Return the on-disk copy of a remote image, downloading it first if needed"""
+    from urllib.parse import urlparse
+    if urlparse(url).hostname not in IMAGE_PROXY_HOSTS:
+        raise HTTPException(status_code=400, detail="Image host not allowed")
+    path = IMAGE_CACHE_DIR / (hash_key(url) + Path(urlparse(url).path).suffix)
+    if path.exists():
+        metrics.inc("unchained_cache_hits_total", cache="images")
+        return path
+    metrics.inc("unchained_cache_misses_total", cache="images")
+    with metrics.span("image_download"):
+        resp = upstream_client.get(url, timeout=10)
+    resp.raise_for_status()
+    metrics.inc("unchained_download_bytes_total", len(resp.content), source="images")
+    prefetch.charge(len(resp.content))
+    tmp_path = path.with_name(path.name + ".part")
+    tmp_path.write_bytes(resp.content)
+    tmp_path.replace(path)
+    metrics.inc("unchained_images_written_total")
+    return path
 
 
 def download_json(url: str, filename: str):
     filepath = os.path.join(METADATA_DIR, filename)
 
     try:
-        response = requests.get(url)
+        response = upstream_client.get(url)
         response.raise_for_status()  # raise error if request failed
         data = response.json()  # parse JSON
 
@@ -222,7 +373,8 @@ def search_library_games(query: str, limit: int):
     matching_games = []
     if query is None:
         # Return all library games if query is None
-        return {"games": games_cache[:limit], "count": len(games_cache)}
+        games = list(games_cache) + search_installed_apps(None, limit)["games"]
+        return {"games": games[:limit], "count": len(games)}
     
     query_lower = query.lower()
     for game in games_cache:
@@ -232,6 +384,7 @@ def search_library_games(query: str, limit: int):
         # Check if metadata name matches the query
         elif game["metadata"] and query_lower in (game["metadata"].get("name", "") or "").lower():
             matching_games.append(game)
+    matching_games += search_installed_apps(query, limit)["games"]
     return {"games": matching_games[:limit], "count": len(matching_games)}
 
 def search_igdb_games(query: str, limit: int):
@@ -253,11 +406,10 @@ def search_igdb_games(query: str, limit: int):
         f'limit 100;'
     )
 
-    resp = requests.post(IGDB_URL, headers=headers, data=query_igdb)
-    if resp.status_code == 401:
-        token = get_igdb_token()
-        headers["Authorization"] = f"Bearer {token}"
-        resp = requests.post(IGDB_URL, headers=headers, data=query_igdb)
+    try:
+        resp = igdb_post(headers, query_igdb, hedge=True)
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"IGDB unavailable: {e}")
 
     if resp.status_code != 200:
         raise HTTPException(status_code=resp.status_code, detail=f"IGDB API error: {resp.text}")
@@ -274,6 +426,7 @@ def search_igdb_games(query: str, limit: int):
 
     return result
 
+@metrics.timed("fetch_game_metadata")
 def fetch_game_metadata(game_name: str):
     game_metadata_dir = METADATA_DIR / game_name
     screenshots_dir = game_metadata_dir / "screenshots"
@@ -311,11 +464,7 @@ def fetch_game_metadata(game_name: str):
 
         f'limit 100;'
     )
-    resp = requests.post(IGDB_URL, headers=headers, data=query_igdb)
-    if resp.status_code == 401:  # token expired
-        token = get_igdb_token()
-        headers["Authorization"] = f"Bearer {token}"
-        resp = requests.post(IGDB_URL, headers=headers, data=query_igdb)
+    resp = igdb_post(headers, query_igdb)
 
     if resp.status_code != 200:
         print(f"[IGDB] Failed for {game_name}: {resp.status_code} {resp.text}")
@@ -331,8 +480,11 @@ def fetch_game_metadata(game_name: str):
     if cover_url:
         if cover_url.startswith("//"):
             cover_url = "https:" + cover_url
-        Image.open(BytesIO(requests.get(cover_url.replace("t_thumb", "t_cover_big")).content)).save(cover_path)
-        Image.open(BytesIO(requests.get(cover_url.replace("t_thumb", "t_720p")).content)).save(big_path)
+        try:
+            download_image(cover_url.replace("t_thumb", "t_cover_big"), cover_path)
+            download_image(cover_url.replace("t_thumb", "t_720p"), big_path)
+        except Exception as e:
+            print(f"[IGDB] Failed to download cover for {game_name}: {e}")
 
     # ----- Screenshots -----
     for idx, sc in enumerate(game.get("screenshots", []), start=1):
@@ -342,7 +494,7 @@ def fetch_game_metadata(game_name: str):
                 sc_url = "https:" + sc_url
             sc_hd_url = sc_url.replace("t_thumb", "t_screenshot_huge")
             try:
-                Image.open(BytesIO(requests.get(sc_hd_url, timeout=10).content)).save(screenshots_dir / f"{idx}.jpg")
+                download_image(sc_hd_url, screenshots_dir / f"{idx}.jpg", timeout=10)
             except Exception as e:
                 print(f"[IGDB] Failed to download screenshot {idx} for {game_name}: {e}")
 
@@ -354,7 +506,7 @@ def fetch_game_metadata(game_name: str):
                 art_url = "https:" + art_url
             art_hd_url = art_url.replace("t_thumb", "t_1080p")
             try:
-                Image.open(BytesIO(requests.get(art_hd_url, timeout=10).content)).save(artworks_dir / f"{idx}.jpg")
+                download_image(art_hd_url, artworks_dir / f"{idx}.jpg", timeout=10)
             except Exception as e:
                 print(f"[IGDB] Failed to download artwork {idx} for {game_name}: {e}")
 
@@ -366,7 +518,7 @@ def fetch_game_metadata(game_name: str):
                 logo_url = "https:" + logo_url
             logo_hd_url = logo_url.replace("t_thumb", "t_720p")
             try:
-                Image.open(BytesIO(requests.get(logo_hd_url, timeout=10).content)).save(logos_dir / f"{idx}.png")
+                download_image(logo_hd_url, logos_dir / f"{idx}.png", timeout=10)
             except Exception as e:
                 print(f"[IGDB] Failed to download logo {idx} for {game_name}: {e}")
 
@@ -409,10 +561,14 @@ def get_directory_size_mb(path):
     total_size = sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
     return total_size / (1024 * 1024)
 
-def scan_games():
+@metrics.timed("scan_library_root")
+def scan_library_root(root_path: Path, deadline: float):
+    """Find games in one library root; filesystem only, so it is safe to time out"""
     games = []
-    for dir_name in os.listdir(DATA_DIR):
-        dir_path = DATA_DIR / dir_name
+    for dir_name in os.listdir(root_path):
+        if time.monotonic() > deadline:
+            raise ScanTimeout(root_path)
+        dir_path = root_path / dir_name
         if not dir_path.is_dir():
             continue
 
@@ -426,24 +582,114 @@ def scan_games():
         exe_files = [f.name for f in dir_path.iterdir() if f.is_file() and f.suffix.lower() == ".exe"]
 
         if exe_files:
-            # Fetch metadata while scanning
-            metadata = fetch_game_metadata(dir_name)
-
-            
             games.append({
-                "id": len(games),
                 "name": dir_name,
                 "appid": appid,
                 "exes": exe_files,
                 "path": dir_path,
                 "category":"library",
-                "metadata": metadata,
+                "metadata": None,
                 "size":get_directory_size_mb(dir_path)
             })
     return games
 
-games_cache = scan_games()
-download_sources_cache = {} #download_json() 
+@metrics.timed("scan_games")
+def scan_games():
+    games = library_roots.scan(scan_library_root)
+    for game in games:
+        # Fetch metadata after scanning, unless that means hitting the network during gameplay
+        if (METADATA_DIR / game["name"] / "metadata.json").exists() or not governor.game_active():
+            try:
+                game["metadata"] = fetch_game_metadata(game["name"])
+            except requests.RequestException as e:
+                # Upstream down or its circuit open: list the game anyway, the next scan fetches again
+                print(f"[IGDB] Failed to fetch metadata for {game['name']}: {e}")
+        else:
+            governor.defer(f"metadata:{game['name']}", lambda name=game["name"]: attach_game_metadata(name))
+    return games
+
+def attach_game_metadata(game_name: str):
+    """Fetch metadata for a library game whose fetch was deferred during a scan"""
+    try:
+        metadata = fetch_game_metadata(game_name)
+    except Exception as e:
+        print(f"[IGDB] Failed to fetch metadata for {game_name}: {e}")
+        return
+    for game in games_cache:
+        if game["name"] == game_name:
+            game["metadata"] = metadata
+    save_library_snapshot()
+
+library_roots = LibraryRoots(BASE_DIR / "libraries.json", DATA_DIR, EXTRA_LIBRARY_ROOTS, limit=governor.limit)
+
+# -------------------- Library snapshot --------------------
+LIBRARY_SNAPSHOT_PATH = CACHE_DIR / "library.snapshot"
+
+def library_snapshot_key():
+    return snapshot.snapshot_key(*(root.path for root in library_roots.roots))
+
+def save_library_snapshot():
+    """Persist the library and tell the other workers to remap it"""
+    try:
+        snapshot.write(LIBRARY_SNAPSHOT_PATH, games_cache, library_snapshot_key(), time.time())
+    except OSError as e:
+        print(f"[LIBRARY] Failed to write snapshot: {e}")
+        return
+    state_store.set("library", {"key": library_snapshot_key().hex(), "count": len(games_cache)})
+
+def reload_library(state):
+    """Follower side of save_library_snapshot()"""
+    global games_cache
+    games = snapshot.load(LIBRARY_SNAPSHOT_PATH, bytes.fromhex(state["key"]))
+    if games is not None:
+        games_cache = games
+        library_roots.seed(games)  # in case this worker takes over as leader
+
+def set_games(games):
+    """Replace the library, persist it and keep serving it from the mapped snapshot"""
+    global games_cache
+    games_cache = games
+    save_library_snapshot()
+    mapped = snapshot.load(LIBRARY_SNAPSHOT_PATH, library_snapshot_key())
+    games_cache = games if mapped is None else mapped
+
+def set_download_sources(sources):
+    global download_sources_cache
+    download_sources_cache = sources
+
+def scan_library(job):
+    """Job: rescan every root and swap the library only if the disk changed"""
+    games = governor.background_call(scan_games)
+    job.check_cancelled()
+    records = [snapshot.encode_record(game) for game in games]
+    changed = not (isinstance(games_cache, snapshot.SnapshotGames) and snapshot.matches(games_cache, records))
+    if changed:
+        print(f"[LIBRARY] Library changed on disk, reloaded {len(games)} games")
+        set_games(games)
+    if job.params.get("download_sources") and DOWNLOAD_SOURCES_URL:
+        sources = download_json(DOWNLOAD_SOURCES_URL, "download_sources.json")
+        if sources is not None:
+            set_download_sources(sources)
+            state_store.set("download_sources", sources)
+    return {"count": len(games_cache), "changed": changed}
+
+job_queue.register("scan", scan_library, priority=10)
+
+games_cache = snapshot.load(LIBRARY_SNAPSHOT_PATH, library_snapshot_key())
+if games_cache is not None:
+    # Roots that are offline on the first scan keep these games instead of losing them
+    library_roots.seed(games_cache)
+if not leader_lock.held:
+    if games_cache is None:
+        games_cache = []  # filled in once the leader publishes its first scan
+elif games_cache is None:
+    set_games(scan_games())
+else:
+    job_queue.enqueue("scan")  # served from the snapshot, check it behind the scenes
+state_store.subscribe("library", reload_library)
+
+download_sources_cache = state_store.get("download_sources", {})
+state_store.subscribe("download_sources", set_download_sources)
                         
 # -------------------- Models --------------------
 from typing import Literal
@@ -478,6 +724,8 @@ class GameInfo(BaseModel):
     category: Literal["library", "peers", "bay","apps"] 
     igdb_id: Optional[int] = None
     size:float 
+    library: Optional[str] = None  # name of the library root the game was found in
+    available: bool = True  # False while its library root is offline or unmounted
 
 class SearchRequest(BaseModel):
     query: Optional[str] = None
@@ -486,85 +734,109 @@ class SearchRequest(BaseModel):
 
 # -------------------- Endpoints --------------------
 
+@app.get("/api/debug/metrics", response_class=PlainTextResponse)
+def debug_metrics():
+    """Prometheus-format latency histograms and counters"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug/profile", response_class=PlainTextResponse)
+def debug_profile():
+    """Collapsed stacks from the sampling profiler (empty unless UNCHAINED_PROFILE=1)"""
+    return metrics.collapsed_stacks()
+
+@app.get("/api/debug/upstream")
+def debug_upstream():
+    """Circuit breaker state and recent latency per upstream host"""
+    return upstream_client.status()
+
+@app.get("/api/debug/jobs")
+def debug_jobs():
+    """Running jobs, job counts by status and per-kind concurrency limits in this worker"""
+    return job_queue.status()
+
 @app.get("/api/library", response_model=List[GameInfo])
 def list_games():
     return games_cache
 
 @app.post("/api/refresh")
 def refresh_games():
-    global games_cache
-    global download_sources_cache
-    games_cache = scan_games()
-    download_sources_cache = download_json()
-    return {"message": "Game list refreshed", "count": len(games_cache)}
+    """Queue a library rescan (and download sources update) and return the job; its result has the game count"""
+    return job_queue.enqueue("scan", {"download_sources": True}, priority=5)
 
 import requests
 from typing import Dict, Any
 
+# -------------------- Flathub catalog --------------------
+flathub_catalog = FlathubCatalog(CACHE_DIR / "flathub", max_age=CACHE_TTL, client=upstream_client)
+
+def refresh_flathub_catalog(force=False):
+    try:
+        flathub_catalog.refresh(force)
+    except requests.RequestException as e:
+        print(f"[FLATHUB] Catalog refresh failed, keeping the local copy: {e}")
+    flathub_catalog.refresh_installed()
+    # Other workers reload the saved catalog and installed list
+    state_store.set("catalog", {"updated": flathub_catalog.state["updated"], "installed": sorted(flathub_catalog.installed)})
+    return {"apps": len(flathub_catalog.index.records), "installed": len(flathub_catalog.installed)}
+
+job_queue.register("catalog", lambda job: refresh_flathub_catalog(job.params.get("force", False)), priority=30)
+
+def keep_flathub_catalog_fresh():
+    """Load the local catalog, then check Flathub for changes every hour (leader only, not while a game runs)"""
+    flathub_catalog.load()
+    while True:
+        if leader_lock.held and flathub_catalog.stale():
+            governor.defer("flathub-catalog", lambda: job_queue.enqueue("catalog"))
+        time.sleep(3600)
+
+threading.Thread(target=keep_flathub_catalog_fresh, name="unchained-flathub", daemon=True).start()
+state_store.subscribe("catalog", lambda state: flathub_catalog.load())
+
+def flatpak_entry_id(app_id: str) -> int:
+    """Stable numeric id for an app's search entry; launch_game accepts it for installed apps"""
+    return int(hash_key(app_id)[:8], 16)
+
+def find_installed_app(entry_id: int):
+    return next((record for record in flathub_catalog.installed_apps()
+                 if flatpak_entry_id(record["app_id"]) == entry_id), None)
+
+def flatpak_app_entry(record, installed=False):
+    """Shape a catalog record like the other search results"""
+    metadata = {
+        "cover": record["icon"],
+        "big": record["icon"],  # Use icon as both cover and big
+        "screenshots": [],
+        "artworks": [],
+        "genres": record["categories"],
+        "platforms": ["Linux"],  # Flatpak apps are primarily for Linux
+        "first_release_date": record["released"],
+        "summary": record["summary"],
+        "steam_id": None  # Not applicable for Flatpak apps
+    }
+    return {
+        'id': flatpak_entry_id(record["app_id"]),
+        'name': record["name"],
+        'appid': record["app_id"],
+        'category': 'apps',
+        'exes': [],  # Flatpak apps don't have traditional EXEs
+        'metadata': metadata,
+        'size': 0.0,  # Size not in the appstream data
+        'installed': installed,
+    }
+
 def search_flatpak_apps(query: str, limit: int) -> Dict[str, Any]:
-    """Search for Flatpak apps using Flathub API"""
+    """Search the local Flathub catalog; works offline once it has been fetched"""
     if query is None:
         # Return empty result when query is None for Flatpak
         return {"games": [], "count": 0}
-    
-    try:
-        # Use Flathub API to search for apps - based on the OpenAPI spec
-        search_url = "https://flathub.org/api/v2/search"
-        
-        # The API expects POST request with JSON body based on the schema
-        payload = {
-            "query": query or "",
-            "size": limit
-        }
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        
-        response = requests.post(search_url, json=payload, headers=headers)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        apps = []
-        # Process the data based on the MeilisearchResponse schema from the API spec
-        hits = data.get('hits', [])
-        for item in hits[:limit]:
-            # Create metadata based on the GameMetadata schema
-            metadata = {
-                "cover": item.get('icon'),
-                "big": item.get('icon'),  # Use icon as both cover and big
-                "screenshots": [],  # Flathub API doesn't provide screenshots in search
-                "artworks": [],  # Flathub API doesn't provide artworks in search
-                "genres": item.get('categories', []),
-                "platforms": ["Linux"],  # Flatpak apps are primarily for Linux
-                "first_release_date": item.get('added_at'),
-                "summary": item.get('summary'),
-                "steam_id": None  # Not applicable for Flatpak apps
-            }
-            
-            app = {
-                'id': item.get('id'),
-                'name': item.get('name'),
-                'appid': item.get('app_id'),
-                'category':'apps',
-                'exes': [],  # Flatpak apps don't have traditional EXEs
-                'metadata': metadata,
-                'size': 0.0  # Size not available from search API
-            }
-            apps.append(app)
-        
-        return {
-            "games": apps,
-            "count": len(apps)
-        }
-    except requests.RequestException as e:
-        print(f"Error searching Flatpak apps via API: {e}")
-        return {"games": [], "count": 0}
-    except Exception as e:
-        print(f"Unexpected error searching Flatpak apps: {e}")
-        return {"games": [], "count": 0}
+    installed = flathub_catalog.installed
+    apps = [flatpak_app_entry(record, record["app_id"] in installed) for record in flathub_catalog.search(query, limit)]
+    return {"games": apps, "count": len(apps)}
+
+def search_installed_apps(query: Optional[str], limit: int):
+    """Flatpaks installed on this machine, listed alongside library games"""
+    apps = [flatpak_app_entry(record, installed=True) for record in flathub_catalog.installed_apps(query)]
+    return {"games": apps[:limit], "count": len(apps)}
 
 def remove_duplicates(games_list):
     """Remove duplicate games from a list based on name and metadata name"""
@@ -585,13 +857,13 @@ def remove_duplicates(games_list):
     
     return unique_games
 
-@app.get("/api/game/igdb/{game_id}")
-def get_igdb_game_metadata(game_id: int):
-    """Get detailed metadata for a specific game by IGDB ID"""
-    for g in games_cache:
-        if g['metadata']['id'] == game_id:
-            return g
-    
+def fetch_igdb_game(game_id: int):
+    """Fetch the raw IGDB record for a game, going through the KV cache"""
+    cache_key = f"igdb:game:{game_id}"
+    cached = kv_get(cache_key)
+    if cached:
+        return cached
+
     headers = {
         "Accept": "application/json"
     }
@@ -599,11 +871,7 @@ def get_igdb_game_metadata(game_id: int):
     fields = "id,name,cover.url,genres.name,platforms.name,first_release_date,summary,screenshots.url,artworks.url,websites.url,rating,total_rating,storyline,category,game_modes.name"
     query = f'fields {fields}; where id = {game_id};'
     
-    resp = requests.post(IGDB_URL, headers=headers, data=query)
-    if resp.status_code == 401:  # token expired
-        token = get_igdb_token()
-        headers["Authorization"] = f"Bearer {token}"
-        resp = requests.post(IGDB_URL, headers=headers, data=query)
+    resp = igdb_post(headers, query)
     
     if resp.status_code != 200:
         raise HTTPException(status_code=resp.status_code, detail=f"IGDB API error: {resp.text}")
@@ -611,14 +879,415 @@ def get_igdb_game_metadata(game_id: int):
     games = resp.json()
     if not games:
         raise HTTPException(status_code=404, detail="Game not found")
-    
 
-    game = games[0]
- 
+    kv_set(cache_key, games[0])
+    return games[0]
+
+@app.get("/api/game/igdb/{game_id}")
+def get_igdb_game_metadata(game_id: int):
+    """Get detailed metadata for a specific game by IGDB ID"""
+    for g in games_cache:
+        if (g.get('metadata') or {}).get('id') == game_id:
+            return g
+
+    try:
+        game = fetch_igdb_game(game_id)
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"IGDB unavailable: {e}")
+
             #game['installed'] = True
 
     return process_game_metadata(game)
 
+@app.get("/api/image")
+def get_cached_image(url: str):
+    """Serve a remote IGDB image from the local image cache"""
+    try:
+        return FileResponse(cache_remote_image(url))
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"Image download failed: {e}")
+
+# -------------------- Prefetch --------------------
+prefetch_scheduler = prefetch.PrefetchScheduler(
+    PREFETCH_BYTES_PER_SECOND, PREFETCH_CPU_SHARE, should_pause=governor.game_active
+)
+
+def prefetch_game(game_id: int):
+    """Warm IGDB details and the hero artwork, the one image the game page loads through /api/image"""
+    game = process_game_metadata(fetch_igdb_game(game_id))
+    # Covers and screenshots are loaded straight from IGDB by the UI, so caching them here would be wasted
+    for url in game["artworks"][-1:]:
+        if url:
+            cache_remote_image(url)
+
+def likely_search_prefixes(query: str, max_prefixes: int = 4):
+    """Guess the next queries from library and cached names that extend what was typed"""
+    query_lower = query.lower()
+    names = []
+    for game in games_cache:
+        names.append(game["name"])
+        if game["metadata"]:
+            names.append(game["metadata"].get("name") or "")
+    prefixes = []
+    for name in names:
+        name_lower = name.lower()
+        if name_lower.startswith(query_lower) and len(name_lower) > len(query_lower):
+            prefix = name_lower[:len(query_lower) + 1]
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+    return prefixes[:max_prefixes]
+
+class PrefetchHint(BaseModel):
+    kind: Literal["game", "query"]
+    game_id: Optional[int] = None
+    category: Optional[str] = None
+    query: Optional[str] = None
+
+@app.post("/api/prefetch/hint")
+def prefetch_hint(hint: PrefetchHint):
+    """Queue background warm-up work for what the user is likely to open next"""
+    if hint.kind == "game" and hint.game_id is not None:
+        prefetch_scheduler.cancel("game")  # focus moved on, the old card no longer matters
+        if hint.category == "library":
+            return prefetch_scheduler.status()
+        prefetch_scheduler.submit(f"game:{hint.game_id}", lambda: prefetch_game(hint.game_id), priority=0, group="game")
+    elif hint.kind == "query" and hint.query:
+        prefetch_scheduler.cancel("query")
+        limit = SearchRequest().limit
+        prefetch_scheduler.submit(f"query:{hint.query}", lambda: search_igdb_games(hint.query, limit), priority=1, group="query")
+        for prefix in likely_search_prefixes(hint.query):
+            prefetch_scheduler.submit(f"query:{prefix}", lambda p=prefix: search_igdb_games(p, limit), priority=5, group="query")
+    return prefetch_scheduler.status()
+
+@app.get("/api/governor")
+def governor_status():
+    """Whether a game is running and how much background work has been deferred"""
+    return governor.status()
+
+# -------------------- Downloads --------------------
+download_manager = DownloadManager(DOWNLOADS_DIR, DOWNLOAD_BYTES_PER_SECOND, limit=governor.limit)
+
+def add_library_game(name: str, path: Path, exes: List[str], size_bytes: int):
+    """Add a game that just landed in DATA_DIR to the library without rescanning"""
+    if not exes:
+        # Same rule as scan_library_root, otherwise the game would vanish on the next scan
+        print(f"[LIBRARY] Not adding {name}: no .exe at the top level of {path}")
+        return
+    game = {
+        "id": max((g["id"] for g in games_cache), default=-1) + 1,
+        "name": name,
+        "appid": None,
+        "exes": exes,
+        "path": path,
+        "category": "library",
+        "metadata": None,
+        "size": size_bytes / (1024 * 1024),
+        "library": library_roots.roots[0].name,
+        "available": True,
+    }
+    appid_path = path / "steam_appid.txt"
+    if appid_path.is_file():
+        game["appid"] = appid_path.read_text(encoding="utf-8").strip()
+    games_cache.append(game)
+    library_roots.roots[0].games.append(dict(game))  # installs land in the default root
+    save_library_snapshot()
+    governor.defer(f"metadata:{name}", lambda: attach_game_metadata(name))
+
+installer = Installer(
+    STAGING_DIR, DATA_DIR, download_manager.state_dir / "installs",
+    on_installed=lambda install: add_library_game(install.name, install.path, install.exes, install.size_bytes),
+)
+
+class StartDownloadRequest(BaseModel):
+    uris: List[HttpUrl]
+    title: Optional[str] = None
+    filename: Optional[str] = None
+    checksum: Optional[str] = None  # "sha256:<hex>", other hashlib names work too
+    max_bytes_per_second: Optional[float] = 0
+    install: bool = True  # extract archives into the library while they download
+
+def get_download_or_404(download_id: str):
+    download = download_manager.get(download_id)
+    if not download:
+        raise HTTPException(status_code=404, detail="Download not found")
+    return download
+
+@app.get("/api/downloads")
+def list_downloads():
+    return download_manager.list()
+
+@app.post("/api/downloads")
+def start_download(request: StartDownloadRequest):
+    """Start downloading one of the entries returned with bay search results"""
+    download = download_manager.add(
+        [str(uri) for uri in request.uris],
+        title=request.title,
+        filename=request.filename,
+        checksum=request.checksum,
+        max_bytes_per_second=request.max_bytes_per_second,
+    )
+    if request.install:
+        installer.start(download, name=request.title)
+    return download.progress()
+
+@app.get("/api/downloads/{download_id}")
+def get_download(download_id: str):
+    return get_download_or_404(download_id).progress()
+
+@app.post("/api/downloads/{download_id}/pause")
+def pause_download(download_id: str):
+    download_manager.pause(get_download_or_404(download_id).id)
+    return download_manager.get(download_id).progress()
+
+@app.post("/api/downloads/{download_id}/resume")
+def resume_download(download_id: str):
+    download_manager.resume(get_download_or_404(download_id).id)
+    return download_manager.get(download_id).progress()
+
+@app.delete("/api/downloads/{download_id}")
+def cancel_download(download_id: str):
+    download = get_download_or_404(download_id)
+    download_manager.cancel(download.id)
+    return download.progress()
+
+@app.get("/api/installs")
+def list_installs():
+    return installer.list()
+
+@app.get("/api/installs/{install_id}")
+def get_install(install_id: str):
+    install = installer.get(install_id)
+    if not install:
+        raise HTTPException(status_code=404, detail="Install not found")
+    return install.to_dict()
+
+# -------------------- Peers --------------------
+def local_game_path(name: str):
+    game = next((g for g in games_cache if g["name"] == name), None)
+    return Path(game["path"]) if game else None
+
+def add_peer_game(name: str, path: Path, size_bytes: int):
+    exes = [f.name for f in path.iterdir() if f.is_file() and f.suffix.lower() == ".exe"]
+    add_library_game(name, path, exes, size_bytes)
+
+peer_node = None
+if PEERS_ENABLED:
+    peer_node = PeerNode(
+        PeerNode.load_instance_id(CACHE_DIR / "peer_id"),
+        os.getenv("UNCHAINED_PEER_NAME") or platform.node(),
+        HTTP_PORT,
+        get_games=lambda: list(games_cache),
+        game_path=local_game_path,
+        cache_dir=CACHE_DIR / "peers",
+        staging_dir=STAGING_DIR,
+        data_dir=DATA_DIR,
+        on_complete=add_peer_game,
+        limit=governor.limit,
+        background_call=governor.background_call,
+    )
+
+def require_peers():
+    if peer_node is None:
+        raise HTTPException(status_code=404, detail="Peer sharing is disabled (set UNCHAINED_PEERS=1)")
+    return peer_node
+
+def search_peer_games(query: str, limit: int):
+    """Games offered by LAN peers that are not already in the local library"""
+    if peer_node is None:
+        return {"games": [], "count": 0}
+    local_names = {g["name"] for g in games_cache}
+    query_lower = (query or "").lower()
+    matching_games = []
+    # Only the leader runs discovery; followers read what it last published
+    remote_games = peer_node.remote_games() if leader_lock.held else state_store.get("peers.games", {})
+    for name, game in remote_games.items():
+        if name in local_names or query_lower not in name.lower():
+            continue
+        matching_games.append({
+            "id": int(hash_key(name)[:8], 16),
+            "name": name,
+            "appid": None,
+            "exes": game["exes"],
+            "category": "peers",
+            "metadata": None,
+            "size": game["size"],
+            "peers": game["peers"],
+        })
+    return {"games": matching_games[:limit], "count": len(matching_games)}
+
+class PeerTransferRequest(BaseModel):
+    name: str
+
+@app.get("/api/peers")
+def list_peers():
+    return require_peers().list_peers()
+
+@app.get("/api/peers/manifest")
+def peer_manifest(since: int = -1, epoch: Optional[str] = None):
+    """This instance's library, or only what changed after `since` if `epoch` is still current"""
+    node = require_peers()
+    node.manifest.update(games_cache)
+    return node.manifest.since(since, epoch)
+
+@app.get("/api/peers/games/{name}/tree")
+def peer_game_tree(name: str):
+    tree = require_peers().game_tree(name)
+    if tree is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return tree
+
+@app.get("/api/peers/games/{name}/chunks/{index}")
+def peer_game_chunk(name: str, index: int):
+    data = require_peers().read_chunk(name, index)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return Response(content=data, media_type="application/octet-stream")
+
+@app.get("/api/peers/transfers")
+def list_peer_transfers():
+    return list(require_peers().transfers.values())
+
+@app.post("/api/peers/transfers")
+def start_peer_transfer(request: PeerTransferRequest):
+    """Copy a game from every peer that has it, verifying each chunk"""
+    return require_peers().start_transfer(request.name)
+
+# -------------------- Library roots --------------------
+class LibraryRootRequest(BaseModel):
+    path: str
+    name: Optional[str] = None
+    timeout: Optional[float] = 30.0
+
+@app.get("/api/libraries")
+def list_libraries():
+    """Configured library roots with their device, status and last scan time"""
+    return library_roots.to_list()
+
+@app.post("/api/libraries")
+def add_library(request: LibraryRootRequest):
+    try:
+        root = library_roots.add(request.path, request.name, request.timeout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**root.to_dict(), "job": job_queue.enqueue("scan")}
+
+@app.delete("/api/libraries/{name}")
+def remove_library(name: str):
+    """Stop scanning a root; its files, metadata and saves are left alone"""
+    try:
+        root = library_roots.remove(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if root is None:
+        raise HTTPException(status_code=404, detail="Library not found")
+    set_games([g for g in games_cache if g.get("library") != name])
+    return root.to_dict()
+
+# -------------------- Apps --------------------
+@app.get("/api/apps/catalog")
+def flathub_catalog_status():
+    """Size and freshness of the local Flathub catalog"""
+    return flathub_catalog.status()
+
+@app.post("/api/apps/catalog/refresh")
+def refresh_apps_catalog():
+    return {**flathub_catalog.status(), "job": job_queue.enqueue("catalog", {"force": True})}
+
+# -------------------- Manifests --------------------
+manifest_store = ManifestStore(
+    METADATA_DIR,
+    workers=lambda: governor.limit("hashing"),
+    background_bytes_per_second=HASH_BYTES_PER_SECOND,
+    background_initializer=lower_current_thread_priority,
+)
+
+def get_game_or_404(game_id: int):
+    game = next((g for g in games_cache if g["id"] == game_id), None)
+    if not game:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return game
+
+def build_manifest(job):
+    manifest = manifest_store.build(job.params["name"], Path(job.params["path"]))
+    return {"root": manifest["root"], "algorithm": manifest["algorithm"], "files": len(manifest["files"]), "size": manifest["size"]}
+
+def verify_manifest(job):
+    report = manifest_store.verify(job.params["name"], Path(job.params["path"]))
+    if report is None:
+        raise ValueError("No manifest to verify against")
+    return report
+
+def build_all_manifests(job):
+    """Hash the whole library at idle priority, reusing unchanged file hashes (so a resumed job skips ahead)"""
+    games = list(games_cache)
+    failed = []
+    pool = None
+    try:
+        for done, game in enumerate(games):
+            job.check_cancelled()
+            job.progress(done, len(games), game["name"])
+            # One pool for the whole pass, replaced only when the governor changes the hashing limit
+            pool = manifest_store.pool(background=True, current=pool)
+            try:
+                manifest_store.build(game["name"], Path(game["path"]), background=True, pool=pool)
+            except OSError as e:
+                print(f"[MANIFEST] Failed for {game['name']}: {e}")
+                failed.append(game["name"])
+    finally:
+        if pool is not None:
+            pool.close()
+    job.progress(len(games), len(games))
+    return {"built": len(games) - len(failed), "failed": failed}
+
+job_queue.register("manifest", build_manifest, priority=5)
+job_queue.register("verify", verify_manifest, priority=5)
+job_queue.register("manifests", build_all_manifests, priority=20, background=True)
+
+@app.get("/api/games/{game_id}/manifest")
+def get_game_manifest(game_id: int):
+    manifest = manifest_store.load(get_game_or_404(game_id)["name"])
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="No manifest yet, POST to build one")
+    return manifest
+
+@app.post("/api/games/{game_id}/manifest")
+def build_game_manifest(game_id: int):
+    """Queue a manifest build; the job result has the root hash, file count and size"""
+    game = get_game_or_404(game_id)
+    return job_queue.enqueue("manifest", {"name": game["name"], "path": str(game["path"])})
+
+@app.post("/api/games/{game_id}/verify")
+def verify_game(game_id: int):
+    """Queue a re-hash of a game; the job result lists modified, missing and unexpected files"""
+    game = get_game_or_404(game_id)
+    if manifest_store.load(game["name"]) is None:
+        raise HTTPException(status_code=404, detail="No manifest to verify against")
+    return job_queue.enqueue("verify", {"name": game["name"], "path": str(game["path"])})
+
+@app.get("/api/manifests")
+def manifests_status():
+    """The latest whole-library build job, or null if there has not been one"""
+    jobs = job_queue.list(kind="manifests", limit=1)
+    return jobs[0] if jobs else None
+
+@app.post("/api/manifests/build")
+def start_manifest_build():
+    return job_queue.enqueue("manifests")
+
+@app.get("/api/manifests/duplicates")
+def manifest_duplicates():
+    """Duplicate installs (same root hash) and files shared between games"""
+    return manifest_store.duplicates([g["name"] for g in games_cache])
+
+@app.get("/api/prefetch")
+def prefetch_status():
+    return prefetch_scheduler.status()
+
+@app.delete("/api/prefetch")
+def cancel_prefetch():
+    prefetch_scheduler.cancel()
+    return prefetch_scheduler.status()
+
 
 
 @app.post("/api/search")
@@ -628,7 +1297,7 @@ def search_games(request: SearchRequest):
 
     if not query:
         # TODO
-        games = games_cache
+        games = list(games_cache) + search_installed_apps(None, 50)["games"]
         print(games)
         library_results = {"games":games,"count":len(games)}
         all_results = [
@@ -667,6 +1336,10 @@ def search_games(request: SearchRequest):
         result = search_flatpak_apps(query, limit)
         result["games"] = remove_duplicates(result["games"])
         return result
+    elif category == "peers":
+        result = search_peer_games(query, limit)
+        result["games"] = remove_duplicates(result["games"])
+        return result
     elif category == "bay":
         result = search_igdb_games(query, limit)
         result["games"] = remove_duplicates(result["games"])
@@ -674,15 +1347,20 @@ def search_games(request: SearchRequest):
     elif category == "all":
         # Search all categories and return combined results with counts
         library_results = search_library_games(query, limit)
-        igdb_results = search_igdb_games(query, limit)
-        apps_results = {"games":[],"count":0}#search_flatpak_apps(query, limit)
-        peers_results = {"games": [], "count": 0}  # Placeholder
+        try:
+            igdb_results = search_igdb_games(query, limit)
+        except HTTPException as e:
+            # Local results are still worth showing when IGDB is down
+            print(f"[IGDB] Search failed: {e.detail}")
+            igdb_results = {"games": [], "count": 0}
+        apps_results = search_flatpak_apps(query, limit)
+        peers_results = search_peer_games(query, limit)
 
         # Combine all results
         all_results = [
             {"category": "library", "results": library_results},
             {"category": "bay", "results": igdb_results},
-            #{"category": "apps", "results": apps_results},
+            {"category": "apps", "results": apps_results},
             {"category": "peers", "results": peers_results}
         ]
 
@@ -712,27 +1390,25 @@ def search_games(request: SearchRequest):
         return result
 
 
-@app.get("/games/{game_id}/launch")
-def launch_game(game_id: int):
-    # Find game
-    game = next((g for g in games_cache if g["id"] == game_id), None)
+def prepare_and_launch(job):
+    """Job: create the Wine prefix and save directory if needed, then start the game"""
+    if job.params.get("flatpak"):
+        return launch_flatpak(job)
+    game = next((g for g in games_cache if g["name"] == job.params["name"]), None)
     if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
-
-    if not game["exes"]:
-        raise HTTPException(status_code=400, detail="No .exe found for this game")
-
-    # Pick executable
+        raise ValueError(f"{job.params['name']} is no longer in the library")
     exe_to_run = game["exes"][0]
      # -------------------- Wine prefix --------------------
     wine_prefix = PREFIXES_DIR / game["name"]
     wine_prefix.mkdir(exist_ok=True)
     if not (wine_prefix / "system.reg").exists():
+        job.progress(0, 2, "Creating Wine prefix")
         subprocess.run(
             ["wineboot", "-i"],
             cwd=game["path"],
             env={**os.environ, "WINEPREFIX": str(wine_prefix)}
         )
+    job.check_cancelled()
 
     # -------------------- Save directory --------------------
     game_save_dir = SAVES_DIR / game["name"]
@@ -750,27 +1426,229 @@ def launch_game(game_id: int):
             pass
 
     # -------------------- Launch game --------------------
-    try:
-        env = os.environ.copy()
-        env["WINEPREFIX"] = str(wine_prefix)
-        env["GAME_SAVE_DIR"] = str(game_save_dir)
-        subprocess.Popen(
-            ["umu-run", exe_to_run],
-            cwd=game["path"],
-            env=env,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to launch: {e}")
+    job.progress(1, 2, "Starting game")
+    env = os.environ.copy()
+    env["WINEPREFIX"] = str(wine_prefix)
+    env["GAME_SAVE_DIR"] = str(game_save_dir)
+    process = subprocess.Popen(
+        ["umu-run", exe_to_run],
+        cwd=game["path"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    governor.supervise(job.params["game_id"], process)
+    return {"pid": process.pid, "exe": exe_to_run}
+
+def launch_flatpak(job):
+    """Start an installed flatpak; it brings its own runtime, so there is no prefix to prepare"""
+    app_id = job.params["flatpak"]
+    process = subprocess.Popen(
+        ["flatpak", "run", app_id],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    governor.supervise(job.params["game_id"], process)
+    return {"pid": process.pid, "flatpak": app_id}
 
+# Launches jump the queue; a launch cut short by a restart is not repeated
+job_queue.register("launch", prepare_and_launch, limit=2, priority=0, resume=False)
+
+@app.get("/games/{game_id}/launch")
+def launch_game(game_id: int):
+    # Find game
+    game = next((g for g in games_cache if g["id"] == game_id), None)
+    if not game:
+        app = find_installed_app(game_id)
+        if app is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        job = job_queue.enqueue("launch", {"game_id": game_id, "name": app["name"], "flatpak": app["app_id"]},
+                                key=app["app_id"])
+        return {"message": f"Launching {app['name']} -> flatpak run {app['app_id']}", "job": job}
+
+    if not game.get("available", True):
+        raise HTTPException(status_code=409, detail=f"Library '{game['library']}' is not available")
+
+    if not game["exes"]:
+        raise HTTPException(status_code=400, detail="No .exe found for this game")
+
+    job = job_queue.enqueue("launch", {"game_id": game_id, "name": game["name"]}, key=game["name"])
     return {
-        "message": f"Launched {game['name']} -> {exe_to_run}",
-        "wine_prefix": str(wine_prefix),
-        "save_dir": str(game_save_dir),
-        "cover_image": game.get("cover_image")
+        "message": f"Launching {game['name']} -> {game['exes'][0]}",
+        "wine_prefix": str(PREFIXES_DIR / game["name"]),
+        "save_dir": str(SAVES_DIR / game["name"]),
+        "cover_image": game.get("cover_image"),
+        "job": job,
     }
 
+# -------------------- Jobs --------------------
+JOB_EVENTS_POLL_SECONDS = 0.25
+JOB_EVENTS_HEARTBEAT_SECONDS = 15
+
+@app.get("/api/jobs")
+def list_jobs(kind: Optional[str] = None, status: Optional[str] = None, limit: int = 100):
+    """Newest jobs first; filter with ?kind=scan&status=running"""
+    return job_queue.list(kind, status, limit)
+
+@app.get("/api/jobs/events")
+async def job_events(request: Request, since: Optional[int] = None):
+    """Server-sent events for every job change, resuming after Last-Event-ID (or ?since=) when given"""
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    if since is None:
+        since = await run_in_threadpool(job_queue.last_event)
+
+    async def stream():
+        after = since
+        idle = 0.0
+        while not await request.is_disconnected():
+            events = await run_in_threadpool(job_queue.events, after)
+            for event in events:
+                after = event["seq"]
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if events:
+                idle = 0.0
+                continue
+            idle += JOB_EVENTS_POLL_SECONDS
+            if idle >= JOB_EVENTS_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    return get_job_or_404(job_id)
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Drop a queued job, or ask a running one to stop at its next checkpoint"""
+    get_job_or_404(job_id)
+    return job_queue.cancel(job_id)
+
+# -------------------- Workers --------------------
+# Endpoints backed by state only the leader worker holds: running games, downloads,
+# installs, LAN sharing, the prefetch queue and everything that enqueues or cancels jobs
+LEADER_ROUTES = (
+    "/api/downloads", "/api/installs", "/api/peers", "/api/manifests", "/api/games/", "/api/prefetch",
+    "/api/governor", "/api/refresh", "/api/libraries", "/api/apps/catalog/refresh", "/api/jobs", "/games/",
+)
+# Jobs live in the shared store, so any worker can read them (and stream their events)
+SHARED_READ_ROUTES = ("/api/jobs",)
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host"}
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection that talks to a Unix domain socket"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(str(self.socket_path))
+
+def forward_to_leader_socket(method, target, headers, body):
+    conn = UnixHTTPConnection(LEADER_SOCKET, timeout=300)
+    try:
+        conn.request(method, target, body=body, headers={k: v for k, v in headers if k.lower() not in HOP_BY_HOP_HEADERS})
+        resp = conn.getresponse()
+        return resp.status, [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_BY_HOP_HEADERS], resp.read()
+    finally:
+        conn.close()
+
+@app.middleware("http")
+async def forward_leader_routes(request, call_next):
+    """In follower workers, hand leader-only endpoints to the leader over its Unix socket"""
+    if leader_lock.held or not request.url.path.startswith(LEADER_ROUTES):
+        return await call_next(request)
+    if request.method == "GET" and request.url.path.startswith(SHARED_READ_ROUTES):
+        return await call_next(request)
+    target = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    body = await request.body()
+    try:
+        status, headers, content = await run_in_threadpool(
+            forward_to_leader_socket, request.method, target, request.headers.items(), body)
+    except OSError as e:
+        return JSONResponse({"detail": f"Leader worker unavailable, retry shortly: {e}"}, status_code=503)
+    metrics.inc("unchained_forwarded_requests_total")
+    return Response(content=content, status_code=status, headers=dict(headers))
+
+# -------------------- LAN access --------------------
+# With peer sharing on, the server listens on the LAN so peers can pull games, but the
+# rest of the API (downloads, launches, settings) has no authentication: LAN clients
+# only get the read-only endpoints a peer transfer needs
+LAN_ROUTES = re.compile(r"^/api/peers/(manifest|games/[^/]+/(tree|chunks/\d+))$")
+
+def is_local_client(client):
+    if client is None:
+        return True  # Unix domain socket
+    try:
+        address = ipaddress.ip_address(client.host)
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+# Registered last so it runs first, before a follower forwards anything to the leader
+@app.middleware("http")
+async def restrict_lan_clients(request, call_next):
+    if is_local_client(request.client) or (request.method == "GET" and LAN_ROUTES.match(request.url.path)):
+        return await call_next(request)
+    metrics.inc("unchained_rejected_lan_requests_total")
+    return JSONResponse({"detail": "Only peer sharing endpoints are available over the LAN"}, status_code=403)
+
+def publish_peer_games():
+    published = None
+    while True:
+        remote_games = peer_node.remote_games()
+        if remote_games != published:
+            state_store.set("peers.games", remote_games)
+            published = remote_games
+        time.sleep(5)
+
+def start_leader_services():
+    """Background work that must run in exactly one worker"""
+    job_queue.start()
+    prefetch_scheduler.start()
+    download_manager.load()
+    installer.load(download_manager.get)
+    if peer_node is not None:
+        peer_node.start()
+        if WORKERS > 1:
+            threading.Thread(target=publish_peer_games, name="unchained-peer-publish", daemon=True).start()
+    if WORKERS > 1:
+        import uvicorn
+        LEADER_SOCKET.unlink(missing_ok=True)
+        server = uvicorn.Server(uvicorn.Config(app, uds=str(LEADER_SOCKET), log_level="warning"))
+        threading.Thread(target=server.run, name="unchained-leader-socket", daemon=True).start()
+
+def wait_for_leadership():
+    """Take over the leader's duties if its process goes away"""
+    while not leader_lock.acquire():
+        time.sleep(1)
+    print(f"[WORKERS] Worker {os.getpid()} is now the leader")
+    start_leader_services()
+    job_queue.enqueue("scan")
+
+if leader_lock.held:
+    start_leader_services()
+else:
+    threading.Thread(target=wait_for_leadership, name="unchained-leader-wait", daemon=True).start()
+
+metrics.describe("unchained_forwarded_requests_total", "counter", "Requests a follower worker forwarded to the leader")
+metrics.describe("unchained_rejected_lan_requests_total", "counter", "Requests from LAN clients to endpoints outside peer sharing")
+
 app.mount("/api/metadata", StaticFiles(directory=METADATA_DIR), name="metadata")
 
 frontend_path = os.path.join(os.path.dirname(__file__), "../frontend/dist")
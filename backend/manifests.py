@@ -0,0 +1,247 @@
+"""
+Per-game file manifests for integrity checks and duplicate detection.
+
+A manifest records every file of a game with its size, mtime and content
+hash, plus a root hash for the whole game. Files are hashed in a process
+pool with large buffered reads, using BLAKE3 or xxHash when installed and
+hashlib's BLAKE2b otherwise. When a manifest is rebuilt, files whose size
+and mtime are unchanged keep their previous hash, so only new or touched
+files are read again. Reads can be throttled to a byte rate so a full
+library can be hashed in the background at idle priority; a pass over the
+whole library shares one HashPool so worker processes start once, not once
+per game.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import metrics
+
+READ_SIZE = 8 * 1024 * 1024
+MANIFEST_NAME = "files.json"
+
+try:
+    import blake3
+    ALGORITHM = "blake3"
+except ImportError:
+    blake3 = None
+    try:
+        import xxhash
+        ALGORITHM = "xxh3_128"
+    except ImportError:
+        xxhash = None
+        ALGORITHM = "blake2b"
+
+
+def _new_hasher():
+    if ALGORITHM == "blake3":
+        return blake3.blake3()
+    if ALGORITHM == "xxh3_128":
+        return xxhash.xxh3_128()
+    return hashlib.blake2b()
+
+
+def hash_file(path, bytes_per_second=0):
+    """Hash one file, sleeping as needed to stay under bytes_per_second (0 = unthrottled)"""
+    hasher = _new_hasher()
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    started = time.monotonic()
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+            total += read
+            if bytes_per_second:
+                ahead = total / bytes_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return hasher.hexdigest()
+
+
+def root_hash(files):
+    """Hash over the sorted (path, size, hash) list of a game"""
+    hasher = hashlib.sha256()
+    for path in sorted(files):
+        entry = files[path]
+        hasher.update(f"{path}\0{entry['size']}\0{entry['hash']}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def scan_files(game_dir: Path):
+    files = {}
+    for path in game_dir.rglob("*"):
+        if path.is_file() and not path.is_symlink():
+            stat = path.stat()
+            files[path.relative_to(game_dir).as_posix()] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+
+class HashPool:
+    """Worker processes that hash files, shared by the builds of one library pass"""
+
+    def __init__(self, workers, bytes_per_second=0, initializer=None):
+        self.workers = workers
+        # Each worker gets a share of the byte budget so the total stays under it
+        self.rate = bytes_per_second / workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+
+    def hash(self, game_dir: Path, relative_paths):
+        paths = list(relative_paths)
+        digests = self.executor.map(hash_file, [game_dir / p for p in paths], [self.rate] * len(paths),
+                                    chunksize=max(1, len(paths) // (self.workers * 8)))
+        return dict(zip(paths, digests))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ManifestStore:
+    def __init__(self, metadata_dir, workers=lambda: 4, background_bytes_per_second=0, background_initializer=None):
+        """Manifests are kept as <metadata_dir>/<game name>/files.json next to the IGDB metadata.
+
+        Background runs are throttled to background_bytes_per_second and their worker
+        processes start with background_initializer (e.g. to drop to idle priority).
+        """
+        self.metadata_dir = Path(metadata_dir)
+        self.workers = workers
+        self.background_bytes_per_second = background_bytes_per_second
+        self.background_initializer = background_initializer
+
+    def path_for(self, game_name: str) -> Path:
+        return self.metadata_dir / game_name / MANIFEST_NAME
+
+    def load(self, game_name: str):
+        path = self.path_for(game_name)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            return None
+
+    def _save(self, game_name, manifest):
+        path = self.path_for(game_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def pool(self, background=False, current=None):
+        """A HashPool to pass to several build() or verify() calls.
+
+        Given the pool in use as current, returns it while it still matches the
+        worker limit, or closes it and returns one sized to the new limit.
+        """
+        workers = max(1, self.workers())
+        if current is not None:
+            if current.workers == workers:
+                return current
+            current.close()
+        if background:
+            return HashPool(workers, self.background_bytes_per_second, self.background_initializer)
+        return HashPool(workers)
+
+    def _hash_many(self, game_dir: Path, relative_paths, background=False, pool=None):
+        if not relative_paths:
+            return {}
+        if pool is not None:
+            return pool.hash(game_dir, relative_paths)
+        with self.pool(background) as pool:
+            return pool.hash(game_dir, relative_paths)
+
+    def build(self, game_name: str, game_dir: Path, background=False, pool=None):
+        """Create or refresh the manifest of a game, reusing hashes of unchanged files.
+
+        pool is a HashPool from pool() to reuse; without one a pool is started for this game.
+        """
+        with metrics.span("manifest_build"):
+            previous = self.load(game_name) or {}
+            reusable = previous.get("files", {}) if previous.get("algorithm") == ALGORITHM else {}
+            files = scan_files(game_dir)
+
+            to_hash = []
+            for path, entry in files.items():
+                old = reusable.get(path)
+                if old and old["size"] == entry["size"] and old["mtime_ns"] == entry["mtime_ns"]:
+                    entry["hash"] = old["hash"]
+                else:
+                    to_hash.append(path)
+            for path, digest in self._hash_many(game_dir, to_hash, background, pool).items():
+                files[path]["hash"] = digest
+            metrics.inc("unchained_manifest_files_hashed_total", len(to_hash))
+            metrics.inc("unchained_manifest_files_reused_total", len(files) - len(to_hash))
+
+            manifest = {
+                "algorithm": ALGORITHM,
+                "root": root_hash(files),
+                "created": time.time(),
+                "size": sum(entry["size"] for entry in files.values()),
+                "files": files,
+            }
+            self._save(game_name, manifest)
+            return manifest
+
+    def verify(self, game_name: str, game_dir: Path, background=False):
+        """Re-hash a game and report how it differs from its stored manifest"""
+        manifest = self.load(game_name)
+        if manifest is None:
+            return None
+        with metrics.span("manifest_verify"):
+            expected = manifest["files"]
+            current = scan_files(game_dir)
+            present = [p for p in expected if p in current]
+            if manifest["algorithm"] == ALGORITHM:
+                hashes = self._hash_many(game_dir, present, background)
+            else:
+                hashes = {}  # hash function not available here; compare sizes only
+            modified = [p for p in present
+                        if current[p]["size"] != expected[p]["size"]
+                        or (p in hashes and hashes[p] != expected[p]["hash"])]
+            missing = sorted(p for p in expected if p not in current)
+            added = sorted(p for p in current if p not in expected)
+            return {
+                "ok": not (modified or missing or added),
+                "algorithm": manifest["algorithm"],
+                "root": manifest["root"],
+                "checked": len(present),
+                "modified": sorted(modified),
+                "missing": missing,
+                "added": added,
+            }
+
+    def duplicates(self, game_names):
+        """Games with identical roots, and file hashes shared by more than one game"""
+        by_root = {}
+        by_file = {}
+        for name in game_names:
+            manifest = self.load(name)
+            if manifest is None:
+                continue
+            by_root.setdefault(manifest["root"], []).append(name)
+            for path, entry in manifest["files"].items():
+                if entry["size"]:
+                    by_file.setdefault((manifest["algorithm"], entry["hash"]), []).append(
+                        {"game": name, "path": path, "size": entry["size"]})
+        duplicate_files = [copies for copies in by_file.values() if len({c["game"] for c in copies}) > 1]
+        return {
+            "games": [names for names in by_root.values() if len(names) > 1],
+            "files": sorted(duplicate_files, key=lambda copies: -copies[0]["size"] * (len(copies) - 1)),
+            "wasted_bytes": sum(copies[0]["size"] * (len(copies) - 1) for copies in duplicate_files),
+        }
+
+
+metrics.describe("unchained_manifest_files_hashed_total", "counter", "Files read and hashed for manifests")
+metrics.describe("unchained_manifest_files_reused_total", "counter", "Manifest hashes reused because size and mtime were unchanged")
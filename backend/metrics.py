@@ -0,0 +1,171 @@
+"""
+Timing spans, counters and latency histograms for the backend.
+
+Everything is kept in-process and rendered as Prometheus text by
+`render()`, which backs the /api/debug/metrics endpoint. An optional
+sampling profiler (UNCHAINED_PROFILE=1) collects collapsed stacks that can
+be fed straight into flamegraph.pl or speedscope.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency buckets in seconds, tuned for anything between a KV lookup and a full library scan
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_help = {}
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name: str, kind: str, text: str):
+    """Register the TYPE and HELP lines for a metric"""
+    _help[name] = (kind, text)
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record one observation in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+        hist[1] += seconds
+        hist[2] += 1
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block of code into the span latency histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("unchained_span_seconds", time.perf_counter() - start, span=name, **labels)
+
+
+def timed(name: str):
+    """Decorator version of `span`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append(("counter", labels, value))
+    for (name, labels), value in histograms.items():
+        by_name[name].append(("histogram", labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        samples = by_name[name]
+        kind, text = _help.get(name, (samples[0][0], name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_kind, labels, value in sorted(samples, key=lambda s: s[1]):
+            if sample_kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            buckets, total, count = value
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+describe("unchained_span_seconds", "histogram", "Duration of instrumented backend operations")
+describe("unchained_http_request_seconds", "histogram", "Duration of HTTP requests by route")
+describe("unchained_http_requests_total", "counter", "HTTP requests by route, method and status")
+describe("unchained_upstream_requests_total", "counter", "Requests made to upstream services")
+describe("unchained_cache_hits_total", "counter", "Cache lookups that returned data")
+describe("unchained_cache_misses_total", "counter", "Cache lookups that returned nothing")
+describe("unchained_download_bytes_total", "counter", "Bytes downloaded from upstream services")
+describe("unchained_images_written_total", "counter", "Images written to the metadata directory")
+
+
+# -------------------- Sampling profiler --------------------
+PROFILE_ENABLED = os.getenv("UNCHAINED_PROFILE") == "1"
+PROFILE_INTERVAL = float(os.getenv("UNCHAINED_PROFILE_INTERVAL_MS", "10")) / 1000
+
+_stacks = defaultdict(int)
+_profiler_thread = None
+
+
+def _sample_forever():
+    me = threading.get_ident()
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            with _lock:
+                _stacks[";".join(reversed(stack))] += 1
+
+
+def collapsed_stacks() -> str:
+    """Return collected samples as collapsed stacks ("a;b;c count" per line)"""
+    with _lock:
+        items = sorted(_stacks.items(), key=lambda item: item[1], reverse=True)
+    return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+def start_profiler(output_path):
+    """Start the sampling profiler if UNCHAINED_PROFILE=1, dumping to output_path at exit"""
+    global _profiler_thread
+    if not PROFILE_ENABLED or _profiler_thread is not None:
+        return
+    _profiler_thread = threading.Thread(target=_sample_forever, name="unchained-profiler", daemon=True)
+    _profiler_thread.start()
+
+    def dump():
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(collapsed_stacks())
+        print(f"[PROFILE] Wrote collapsed stacks to {output_path}")
+
+    atexit.register(dump)
+    print(f"[PROFILE] Sampling every {PROFILE_INTERVAL * 1000:g} ms")
@@ -0,0 +1,451 @@
+"""
+LAN game sharing between launcher instances.
+
+Discovery: every instance announces itself on a UDP multicast group with
+its id, HTTP port and library epoch and version. Other instances that hear
+it pull the library manifest from GET /api/peers/manifest?since=<version>
+&epoch=<epoch>, which answers with only the changes since that version when
+it still has them. Versions restart from zero with every run, so the epoch
+is new on each start and a peer asking about another epoch gets the full
+manifest.
+
+Transfer: a game directory is cut into fixed-size chunks (per file, in
+sorted path order) and a Merkle tree is built over the chunk hashes. A
+downloading instance fetches the tree once, checks it against the root
+advertised by the peers, then pulls chunks from every peer that has the
+game in parallel, verifying each one against its leaf. Chunks already on
+disk that match their leaf are skipped, so an interrupted transfer resumes
+by re-hashing what it has.
+
+Sharing is opt-in (UNCHAINED_PEERS=1) and needs the server bound to a LAN
+address. LAN clients can only reach the manifest, tree and chunk endpoints;
+everything else answers loopback clients only. Several instances can run on
+one machine with different ports and UNCHAINED_BASE_DIR roots.
+"""
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+import requests
+
+from . import metrics
+from .installer import safe_member_path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+MULTICAST_GROUP = "239.255.77.77"
+DISCOVERY_PORT = int(os.getenv("UNCHAINED_DISCOVERY_PORT", 47777))
+ANNOUNCE_INTERVAL = 5
+PEER_TIMEOUT = 20
+REQUEST_TIMEOUT = (5, 30)
+TREE_RECHECK_SECONDS = 30  # how long a served tree is trusted without re-listing the game's files
+
+
+# -------------------- Chunking and Merkle trees --------------------
+def list_game_files(root: Path):
+    """Files under a game directory in the stable order used for chunk numbering"""
+    files = []
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and not path.name.startswith(".unchained"):
+            stat = path.stat()
+            files.append({"path": path.relative_to(root).as_posix(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return files
+
+
+def chunk_spans(files, chunk_size=CHUNK_SIZE):
+    """(file index, offset, length) for every chunk; chunks never cross file boundaries"""
+    spans = []
+    for file_index, entry in enumerate(files):
+        for offset in range(0, entry["size"], chunk_size):
+            spans.append((file_index, offset, min(chunk_size, entry["size"] - offset)))
+    return spans
+
+
+def merkle_root(leaves):
+    """Root of a binary SHA-256 tree over hex leaf hashes (odd nodes are paired with themselves)"""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def read_span(root: Path, files, span):
+    file_index, offset, length = span
+    with open(safe_member_path(root, files[file_index]["path"]), "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def build_tree(root: Path, chunk_size=CHUNK_SIZE):
+    files = list_game_files(root)
+    leaves = [hashlib.sha256(read_span(root, files, span)).hexdigest() for span in chunk_spans(files, chunk_size)]
+    return {
+        "root": merkle_root(leaves),
+        "chunk_size": chunk_size,
+        "files": [{"path": f["path"], "size": f["size"]} for f in files],
+        "leaves": leaves,
+        "signature": [[f["path"], f["size"], f["mtime_ns"]] for f in files],
+    }
+
+
+# -------------------- Library manifest --------------------
+class LibraryManifest:
+    """Versioned view of the local library that can answer with deltas"""
+
+    def __init__(self, history=256):
+        self.epoch = uuid.uuid4().hex[:12]  # versions are only comparable within one run
+        self.version = 0
+        self.games = {}
+        self.log = deque(maxlen=history)  # (version, change)
+        self.lock = threading.Lock()
+
+    def update(self, games):
+        """Diff the current library against the last snapshot and record changes"""
+        snapshot = {g["name"]: {"name": g["name"], "size": g["size"], "exes": g["exes"]} for g in games}
+        with self.lock:
+            changes = [{"op": "remove", "name": name} for name in self.games if name not in snapshot]
+            changes += [{"op": "put", "game": game} for name, game in snapshot.items() if self.games.get(name) != game]
+            for change in changes:
+                self.version += 1
+                self.log.append((self.version, change))
+            self.games = snapshot
+            return bool(changes)
+
+    def since(self, version: int, epoch=None):
+        with self.lock:
+            if epoch == self.epoch and self.log and self.log[0][0] - 1 <= version <= self.version:
+                return {"epoch": self.epoch, "version": self.version, "full": False,
+                        "changes": [c for v, c in self.log if v > version]}
+            return {"epoch": self.epoch, "version": self.version, "full": True, "games": list(self.games.values())}
+
+
+# -------------------- Peer node --------------------
+class PeerNode:
+    def __init__(self, instance_id, name, http_port, get_games, game_path, cache_dir, staging_dir, data_dir,
+                 on_complete=lambda name, path, size_bytes: None, limit=lambda kind: 4, background_call=None):
+        self.instance_id = instance_id
+        self.name = name
+        self.http_port = http_port
+        self.get_games = get_games
+        self.game_path = game_path  # name -> Path of a local game, or None
+        self.cache_dir = Path(cache_dir)
+        self.staging_dir = Path(staging_dir)
+        self.data_dir = Path(data_dir)
+        self.on_complete = on_complete
+        self.limit = limit
+        self.background_call = background_call or (lambda func, *args: func(*args))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.manifest = LibraryManifest()
+        self._trees = {}  # name -> (game dir mtime_ns, time checked, tree), for serving chunks
+        self.peers = {}
+        self.transfers = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+    @staticmethod
+    def load_instance_id(path: Path):
+        if path.exists():
+            return path.read_text(encoding="utf-8").strip()
+        instance_id = uuid.uuid4().hex
+        path.write_text(instance_id, encoding="utf-8")
+        return instance_id
+
+    def start(self):
+        self.manifest.update(self.get_games())
+        for target in (self._announce_loop, self._listen_loop):
+            threading.Thread(target=target, name=f"peers-{target.__name__.strip('_')}", daemon=True).start()
+        print(f"[PEERS] Sharing as {self.name} ({self.instance_id[:8]}) on port {self.http_port}")
+
+    # -------------------- Discovery --------------------
+    def _announce_loop(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        while True:
+            self.manifest.update(self.get_games())
+            message = json.dumps({
+                "id": self.instance_id,
+                "name": self.name,
+                "port": self.http_port,
+                "epoch": self.manifest.epoch,
+                "version": self.manifest.version,
+            }).encode("utf-8")
+            try:
+                sock.sendto(message, (MULTICAST_GROUP, DISCOVERY_PORT))
+            except OSError as e:
+                print(f"[PEERS] Announce failed: {e}")
+            self._expire_peers()
+            time.sleep(ANNOUNCE_INTERVAL)
+
+    def _listen_loop(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # several instances on one machine
+        try:
+            sock.bind(("", DISCOVERY_PORT))
+            membership = struct.pack("4sl", socket.inet_aton(MULTICAST_GROUP), socket.INADDR_ANY)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except OSError as e:
+            print(f"[PEERS] Discovery disabled: {e}")
+            return
+        while True:
+            data, (address, _) = sock.recvfrom(4096)
+            try:
+                announce = json.loads(data)
+            except ValueError:
+                continue
+            if announce.get("id") == self.instance_id:
+                continue
+            self._on_announce(announce, address)
+
+    def _on_announce(self, announce, address):
+        with self.lock:
+            peer = self.peers.setdefault(announce["id"], {
+                "id": announce["id"], "games": {}, "epoch": None, "version": -1, "syncing": False,
+            })
+            peer.update(name=announce.get("name"), address=address, port=announce["port"], last_seen=time.time())
+            changed = (announce.get("epoch"), announce.get("version", 0)) != (peer["epoch"], peer["version"])
+            needs_sync = changed and not peer["syncing"]
+            if needs_sync:
+                peer["syncing"] = True
+        if needs_sync:
+            threading.Thread(target=self._sync_peer, args=(peer,), daemon=True).start()
+
+    def _expire_peers(self):
+        with self.lock:
+            for peer_id in [p for p, peer in self.peers.items() if time.time() - peer["last_seen"] > PEER_TIMEOUT]:
+                print(f"[PEERS] Lost {self.peers[peer_id]['name']}")
+                del self.peers[peer_id]
+
+    def _peer_url(self, peer, path):
+        return f"http://{peer['address']}:{peer['port']}{path}"
+
+    def _sync_peer(self, peer):
+        """Pull the peer's library manifest, asking only for changes since the version we have"""
+        params = {"since": peer["version"]}
+        if peer["epoch"]:
+            params["epoch"] = peer["epoch"]
+        try:
+            resp = self.session.get(self._peer_url(peer, "/api/peers/manifest"), params=params, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+            manifest = resp.json()
+            metrics.inc("unchained_peer_manifest_syncs_total", kind="full" if manifest["full"] else "delta")
+            with self.lock:
+                if manifest["full"]:
+                    peer["games"] = {g["name"]: g for g in manifest["games"]}
+                else:
+                    for change in manifest["changes"]:
+                        if change["op"] == "remove":
+                            peer["games"].pop(change["name"], None)
+                        else:
+                            peer["games"][change["game"]["name"]] = change["game"]
+                peer["epoch"] = manifest.get("epoch")
+                peer["version"] = manifest["version"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"[PEERS] Sync with {peer.get('name')} failed: {e}")
+        finally:
+            peer["syncing"] = False
+
+    def list_peers(self):
+        with self.lock:
+            return [{k: v for k, v in peer.items() if k != "games"} | {"games": len(peer["games"])}
+                    for peer in self.peers.values()]
+
+    def remote_games(self):
+        """Games offered by peers, merged by name, with the peers that have them"""
+        offered = {}
+        with self.lock:
+            for peer in self.peers.values():
+                for name, game in peer["games"].items():
+                    entry = offered.setdefault(name, {**game, "peers": []})
+                    entry["peers"].append(peer["id"])
+        return offered
+
+    # -------------------- Serving --------------------
+    def game_tree(self, name):
+        """Merkle tree for a local game, recomputed only when its files changed"""
+        root = self.game_path(name)
+        if root is None:
+            return None
+        cache_path = self.cache_dir / (hashlib.sha256(name.encode("utf-8")).hexdigest() + ".json")
+        signature = [[f["path"], f["size"], f["mtime_ns"]] for f in list_game_files(root)]
+        if cache_path.exists():
+            try:
+                cached = json.loads(cache_path.read_text(encoding="utf-8"))
+                if cached.get("signature") == signature:
+                    return cached
+            except ValueError:
+                pass
+        with metrics.span("peer_build_tree"):
+            tree = self.background_call(build_tree, root)
+        cache_path.write_text(json.dumps(tree), encoding="utf-8")
+        return tree
+
+    def _served_tree(self, name):
+        """game_tree() for chunk requests: re-listed only when the game directory's mtime moves or every
+        TREE_RECHECK_SECONDS, instead of for every chunk (requesters verify each chunk anyway)"""
+        root = self.game_path(name)
+        if root is None:
+            return None
+        try:
+            mtime_ns = root.stat().st_mtime_ns
+        except OSError:
+            return None
+        cached = self._trees.get(name)
+        if cached and cached[0] == mtime_ns and time.monotonic() - cached[1] < TREE_RECHECK_SECONDS:
+            return cached[2]
+        tree = self.game_tree(name)
+        if tree is not None:
+            self._trees[name] = (mtime_ns, time.monotonic(), tree)
+        return tree
+
+    def read_chunk(self, name, index):
+        tree = self._served_tree(name)
+        if tree is None:
+            return None
+        spans = chunk_spans(tree["files"], tree["chunk_size"])
+        if not 0 <= index < len(spans):
+            return None
+        data = read_span(self.game_path(name), tree["files"], spans[index])
+        metrics.inc("unchained_peer_bytes_total", len(data), direction="sent")
+        return data
+
+    # -------------------- Transfers --------------------
+    def start_transfer(self, name):
+        with self.lock:
+            existing = self.transfers.get(name)
+            if existing and existing["status"] in ("starting", "transferring"):
+                return existing
+            transfer = {"name": name, "status": "starting", "error": None, "chunks_done": 0, "chunks_total": 0,
+                        "bytes": 0, "peers": [], "root": None}
+            self.transfers[name] = transfer
+        threading.Thread(target=self._run_transfer, args=(transfer,), name=f"peer-transfer-{name}", daemon=True).start()
+        return transfer
+
+    def _run_transfer(self, transfer):
+        name = transfer["name"]
+        try:
+            if not name or Path(name).name != name or name in (".", ".."):
+                raise ValueError(f"Invalid game name: {name!r}")
+            if (self.data_dir / name).exists():
+                raise FileExistsError(f"{name} is already installed")
+            with self.lock:
+                sources = [dict(p) for p in self.peers.values() if name in p["games"]]
+            if not sources:
+                raise LookupError(f"No peer has {name}")
+            tree, sources = self._agree_on_tree(name, sources)
+            transfer.update(root=tree["root"], peers=[p["id"] for p in sources], status="transferring")
+
+            staging = self.staging_dir / f"peer-{tree['root'][:16]}"
+            spans = chunk_spans(tree["files"], tree["chunk_size"])
+            transfer["chunks_total"] = len(spans)
+            self._prepare_files(staging, tree["files"])
+
+            # Resume: anything already on disk that matches its leaf is kept
+            missing = []
+            for index, span in enumerate(spans):
+                if hashlib.sha256(read_span(staging, tree["files"], span)).hexdigest() == tree["leaves"][index]:
+                    transfer["chunks_done"] += 1
+                else:
+                    missing.append(index)
+
+            with ThreadPoolExecutor(max_workers=max(1, self.limit("connections"))) as pool:
+                for future in [pool.submit(self._fetch_chunk, transfer, tree, staging, sources, spans, i) for i in missing]:
+                    future.result()
+
+            destination = self.data_dir / name
+            os.rename(staging, destination)
+            transfer["status"] = "completed"
+            print(f"[PEERS] Received {name} from {len(sources)} peer(s)")
+        except Exception as e:
+            transfer["status"] = "failed"
+            transfer["error"] = str(e)
+            print(f"[PEERS] Transfer of {name} failed: {e}")
+            return
+        try:
+            self.on_complete(name, destination, sum(f["size"] for f in tree["files"]))
+        except Exception as e:
+            print(f"[PEERS] Completion hook failed for {name}: {e}")
+
+    def _agree_on_tree(self, name, sources):
+        """Fetch the tree from the first peer whose leaves hash to the root most peers report"""
+        trees = {}
+        for peer in sources:
+            try:
+                resp = self.session.get(self._peer_url(peer, f"/api/peers/games/{quote(name, safe='')}/tree"),
+                                        timeout=REQUEST_TIMEOUT)
+                resp.raise_for_status()
+                tree = resp.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"[PEERS] {peer.get('name')} could not send the tree for {name}: {e}")
+                continue
+            if merkle_root(tree["leaves"]) != tree["root"]:
+                print(f"[PEERS] {peer.get('name')} sent an inconsistent tree for {name}")
+                continue
+            try:
+                # Paths come from the peer; never let one point outside the staging directory
+                for entry in tree["files"]:
+                    safe_member_path(self.staging_dir, entry["path"])
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"[PEERS] {peer.get('name')} sent an unsafe tree for {name}: {e}")
+                continue
+            trees.setdefault(tree["root"], (tree, []))[1].append(peer)
+        if not trees:
+            raise LookupError(f"No peer could provide a valid tree for {name}")
+        return max(trees.values(), key=lambda item: len(item[1]))
+
+    @staticmethod
+    def _prepare_files(staging, files):
+        for entry in files:
+            path = safe_member_path(staging, entry["path"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "ab") as f:
+                if f.tell() != entry["size"]:
+                    f.truncate(entry["size"])
+
+    def _fetch_chunk(self, transfer, tree, staging, sources, spans, index):
+        file_index, offset, length = spans[index]
+        last_error = None
+        # Spread chunks across peers, falling through to the others on failure or bad data
+        for attempt in range(len(sources)):
+            peer = sources[(index + attempt) % len(sources)]
+            try:
+                resp = self.session.get(
+                    self._peer_url(peer, f"/api/peers/games/{quote(transfer['name'], safe='')}/chunks/{index}"),
+                    timeout=REQUEST_TIMEOUT)
+                resp.raise_for_status()
+                data = resp.content
+                if len(data) != length or hashlib.sha256(data).hexdigest() != tree["leaves"][index]:
+                    metrics.inc("unchained_peer_bad_chunks_total")
+                    raise ValueError(f"chunk {index} from {peer.get('name')} failed verification")
+                fd = os.open(safe_member_path(staging, tree["files"][file_index]["path"]), os.O_WRONLY)
+                try:
+                    os.pwrite(fd, data, offset)
+                finally:
+                    os.close(fd)
+                transfer["chunks_done"] += 1
+                transfer["bytes"] += length
+                metrics.inc("unchained_peer_bytes_total", length, direction="received")
+                return
+            except (requests.RequestException, ValueError, OSError) as e:
+                last_error = e
+        raise last_error
+
+
+metrics.describe("unchained_peer_bytes_total", "counter", "Game bytes exchanged with LAN peers")
+metrics.describe("unchained_peer_manifest_syncs_total", "counter", "Library manifests pulled from peers")
+metrics.describe("unchained_peer_bad_chunks_total", "counter", "Peer chunks rejected by Merkle verification")
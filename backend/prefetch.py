@@ -0,0 +1,145 @@
+"""
+Low-priority background scheduler for warming caches ahead of the user.
+
+The frontend sends hints (the focused game card, the letters typed so far)
+and the backend turns them into prefetch tasks. Tasks run one at a time on
+a single worker thread, are deduplicated by key, can be cancelled by group,
+stay inside a bandwidth and CPU budget and are held back entirely while
+`should_pause()` returns True (e.g. while a game is running).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from . import metrics
+
+_local = threading.local()
+
+
+def charge(num_bytes: int):
+    """Account downloaded bytes against the budget of the prefetch task running on this thread"""
+    task = getattr(_local, "task", None)
+    if task is not None:
+        task["bytes"] += num_bytes
+
+
+class PrefetchScheduler:
+    def __init__(self, bytes_per_second: float, cpu_share: float, should_pause=lambda: False, max_queue: int = 64):
+        self.bytes_per_second = bytes_per_second
+        self.cpu_share = cpu_share
+        self.should_pause = should_pause
+        self.max_queue = max_queue
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._tasks = {}  # key -> task dict, for dedup and cancellation
+        self._seq = itertools.count()
+        self._paused = False
+        self._thread = None
+        self.stats = {"queued": 0, "done": 0, "failed": 0, "cancelled": 0, "deduplicated": 0, "bytes": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="unchained-prefetch", daemon=True)
+            self._thread.start()
+
+    def submit(self, key: str, func, priority: int = 10, group: str = "default"):
+        """Queue func() unless a task with the same key is already pending. Lower priority runs first."""
+        with self._cond:
+            if key in self._tasks:
+                self.stats["deduplicated"] += 1
+                return False
+            if len(self._tasks) >= self.max_queue:
+                self._drop_lowest()
+            task = {"key": key, "func": func, "group": group, "cancelled": False, "bytes": 0}
+            self._tasks[key] = task
+            heapq.heappush(self._heap, (priority, next(self._seq), task))
+            self.stats["queued"] += 1
+            self._cond.notify()
+        return True
+
+    def _drop_lowest(self):
+        _, _, task = max(self._heap, key=lambda item: (item[0], item[1]))
+        self._cancel_task(task)
+
+    def _cancel_task(self, task):
+        task["cancelled"] = True
+        self._tasks.pop(task["key"], None)
+        self.stats["cancelled"] += 1
+        metrics.inc("unchained_prefetch_tasks_total", result="cancelled")
+
+    def cancel(self, group: str = None):
+        """Cancel pending tasks in a group, or all pending tasks when group is None"""
+        with self._cond:
+            for task in list(self._tasks.values()):
+                if group is None or task["group"] == group:
+                    self._cancel_task(task)
+            self._heap = [item for item in self._heap if not item[2]["cancelled"]]
+            heapq.heapify(self._heap)
+
+    def pause(self):
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {
+                **self.stats,
+                "pending": len(self._tasks),
+                "paused": self._paused or bool(self.should_pause()),
+            }
+
+    def _next_task(self):
+        with self._cond:
+            while True:
+                if self._heap and not self._paused and not self.should_pause():
+                    _, _, task = heapq.heappop(self._heap)
+                    if task["cancelled"]:
+                        continue
+                    self._tasks.pop(task["key"], None)
+                    return task
+                # should_pause is polled, so wake up periodically even without notify()
+                self._cond.wait(timeout=1.0)
+
+    def _run(self):
+        while True:
+            task = self._next_task()
+            _local.task = task
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                with metrics.span("prefetch_task", group=task["group"]):
+                    task["func"]()
+                self.stats["done"] += 1
+                metrics.inc("unchained_prefetch_tasks_total", result="done")
+            except Exception as e:
+                self.stats["failed"] += 1
+                metrics.inc("unchained_prefetch_tasks_total", result="failed")
+                print(f"[PREFETCH] {task['key']} failed: {e}")
+            finally:
+                _local.task = None
+
+            self.stats["bytes"] += task["bytes"]
+            metrics.inc("unchained_prefetch_bytes_total", task["bytes"])
+
+            # Stay inside the budget: sleep long enough that bytes/sec and the CPU
+            # fraction used by this worker average out to the configured limits
+            elapsed = time.perf_counter() - wall_start
+            cpu_used = time.thread_time() - cpu_start
+            delay = 0.0
+            if self.bytes_per_second > 0:
+                delay = max(delay, task["bytes"] / self.bytes_per_second - elapsed)
+            if 0 < self.cpu_share < 1:
+                delay = max(delay, cpu_used / self.cpu_share - elapsed)
+            if delay > 0:
+                time.sleep(delay)
+
+
+metrics.describe("unchained_prefetch_tasks_total", "counter", "Prefetch tasks by outcome")
+metrics.describe("unchained_prefetch_bytes_total", "counter", "Bytes downloaded by prefetch tasks")
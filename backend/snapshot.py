@@ -0,0 +1,148 @@
+"""
+Memory-mapped library snapshot for fast warm startup.
+
+The library (games, resolved metadata, sizes, exe lists) is written to one
+binary file: a fixed header, an index of (offset, length) pairs and one
+compact JSON record per game. On startup the file is mapped and wrapped in
+a SnapshotGames list; a record is only decoded the first time that game is
+looked at, so opening a large library costs a header read, and records that
+are never touched stay in the page cache instead of the Python heap.
+
+The header carries a format version and a key (a hash of the library roots);
+a snapshot written by another version or for other roots is ignored.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableSequence
+from pathlib import Path
+
+from . import metrics
+
+MAGIC = b"UCSNAP\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII32sd")  # magic, version, count, key, created
+INDEX_ENTRY = struct.Struct("<QI")  # offset, length
+
+
+def snapshot_key(*parts) -> bytes:
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).digest()
+
+
+def encode_record(game: dict) -> bytes:
+    return json.dumps(game, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+
+
+def decode_record(data) -> dict:
+    game = json.loads(bytes(data))
+    if game.get("path") is not None:
+        game["path"] = Path(game["path"])
+    return game
+
+
+class SnapshotGames(MutableSequence):
+    """A list of game dicts backed by a mapped snapshot, decoded on first access"""
+
+    def __init__(self, buffer=None, count=0, index_offset=0):
+        self._buffer = buffer
+        self._index_offset = index_offset
+        # An int is a record still in the snapshot, a dict one that was decoded or added
+        self._items = list(range(count))
+
+    def _record_bytes(self, i):
+        offset, length = INDEX_ENTRY.unpack_from(self._buffer, self._index_offset + i * INDEX_ENTRY.size)
+        return self._buffer[offset:offset + length]
+
+    def _materialize(self, position):
+        item = self._items[position]
+        if isinstance(item, int):
+            item = self._items[position] = decode_record(self._record_bytes(item))
+        return item
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._materialize(i) for i in range(*position.indices(len(self._items)))]
+        return self._materialize(position)
+
+    def __setitem__(self, position, value):
+        if isinstance(position, slice):
+            self._items[position] = list(value)
+        else:
+            self._items[position] = value
+
+    def __delitem__(self, position):
+        del self._items[position]
+
+    def __len__(self):
+        return len(self._items)
+
+    def insert(self, position, value):
+        self._items.insert(position, value)
+
+    def __repr__(self):
+        return f"<SnapshotGames {len(self)} games, {self.decoded()} decoded>"
+
+    def decoded(self):
+        return sum(1 for item in self._items if not isinstance(item, int))
+
+    def encoded_records(self):
+        """Serialized form of every game; untouched records are copied as-is from the map"""
+        for item in self._items:
+            yield bytes(self._record_bytes(item)) if isinstance(item, int) else encode_record(item)
+
+
+def write(path, games, key: bytes, created: float):
+    """Atomically write games (dicts or a SnapshotGames) to path"""
+    path = Path(path)
+    records = list(games.encoded_records() if isinstance(games, SnapshotGames) else map(encode_record, games))
+    offset = HEADER.size + INDEX_ENTRY.size * len(records)
+    index = bytearray()
+    for record in records:
+        index += INDEX_ENTRY.pack(offset, len(record))
+        offset += len(record)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), key, created))
+        f.write(index)
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+    metrics.inc("unchained_snapshot_writes_total")
+    return records
+
+
+def load(path, key: bytes):
+    """Map a snapshot and return its games, or None if it is missing, stale or damaged.
+
+    A snapshot of an empty library is an empty (falsy) SnapshotGames, so
+    callers must test `is None` to tell "no snapshot" apart from it.
+    """
+    with metrics.span("snapshot_load"):
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size:
+                    return None
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        magic, version, count, stored_key, _created = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION or stored_key != key:
+            buffer.close()
+            return None
+        if size < HEADER.size + count * INDEX_ENTRY.size:
+            buffer.close()
+            return None
+        return SnapshotGames(buffer, count, HEADER.size)
+
+
+def matches(games: SnapshotGames, records) -> bool:
+    """Whether a fresh scan (as encoded records) is identical to the snapshot"""
+    if len(games) != len(records):
+        return False
+    return all(old == new for old, new in zip(games.encoded_records(), records))
+
+
+metrics.describe("unchained_snapshot_writes_total", "counter", "Library snapshots written")
@@ -0,0 +1,141 @@
+"""
+State shared between backend worker processes.
+
+When the server runs with several workers, each one is a separate process
+with its own module globals. SharedStore is a small SQLite database (WAL
+mode, so readers never block the writer) holding:
+
+- versioned state entries that workers publish and subscribe to; a watcher
+  thread polls `PRAGMA data_version`, which changes whenever another
+  connection commits, and calls subscribers of entries whose version moved
+- the KV cache for upstream responses, with its write timestamps
+
+LeaderLock elects one worker to own the work that must not run twice
+(downloads, LAN sharing, library scans, prefetching) with an flock on a
+lock file, which the kernel releases if the leader dies.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-worker mode, the only process leads
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, time REAL NOT NULL, data TEXT NOT NULL);
+"""
+
+
+class SharedStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._subscribers = {}  # key -> [callback(value)]
+        self._seen = {}  # key -> last version this process wrote or handled
+        self._watcher = None
+        with self.connect() as db:
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        """This thread's connection to the store database"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    # -------------------- State --------------------
+    def get(self, key, default=None):
+        row = self.connect().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        """Store value and notify other workers subscribed to key"""
+        db = self.connect()
+        row = db.execute(
+            "INSERT INTO state (key, value, version) VALUES (?, ?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1 "
+            "RETURNING version",
+            (key, json.dumps(value)),
+        ).fetchone()
+        self._seen[key] = row[0]  # our own write needs no notification
+
+    def subscribe(self, key, callback):
+        self._subscribers.setdefault(key, []).append(callback)
+        if key not in self._seen:
+            row = self.connect().execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()
+            self._seen[key] = row[0] if row else 0
+        self._start_watcher()
+
+    def _start_watcher(self, interval=0.2):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name="unchained-store-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch(self, interval):
+        db = self.connect()
+        data_version = None
+        while True:
+            current = db.execute("PRAGMA data_version").fetchone()[0]
+            if current != data_version:
+                data_version = current
+                for key, version, value in db.execute("SELECT key, version, value FROM state").fetchall():
+                    if key in self._subscribers and version != self._seen.get(key):
+                        self._seen[key] = version
+                        for callback in self._subscribers[key]:
+                            try:
+                                callback(json.loads(value))
+                            except Exception as e:
+                                print(f"[STORE] Subscriber for {key} failed: {e}")
+            time.sleep(interval)
+
+    # -------------------- Cache --------------------
+    def cache_get(self, key):
+        """(time written, data) or None"""
+        row = self.connect().execute("SELECT time, data FROM cache WHERE key = ?", (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def cache_set(self, key, data):
+        self.connect().execute(
+            "INSERT OR REPLACE INTO cache (key, time, data) VALUES (?, ?, ?)", (key, time.time(), json.dumps(data)))
+
+    def cache_delete(self, key):
+        self.connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class LeaderLock:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Try to become the leader without blocking; stays leader until the process exits"""
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
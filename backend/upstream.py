@@ -0,0 +1,251 @@
+"""
+Shared client for upstream services (IGDB proxy, image CDNs, Flathub).
+
+All outbound calls go through one pooled requests session with default
+timeouts. Each host gets a circuit breaker: after a run of failures
+(connection errors, timeouts, 5xx) calls fail fast with CircuitOpenError
+until a cool-down has passed, then a single trial call decides whether the
+breaker closes again. Idempotent calls are retried with exponential
+backoff and jitter; 429 and 503 answers honour Retry-After. A call can be
+hedged: if the first attempt has not answered after the host's recent p95
+latency, a second identical request is sent and whichever answers first
+wins.
+
+Errors raised are requests exceptions, so existing `except
+requests.RequestException` handlers keep working.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+DEFAULT_TIMEOUT = (5, 20)  # connect, read
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 30.0
+MIN_HEDGE_DELAY = 0.05
+DEFAULT_HEDGE_DELAY = 0.5
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The host failed repeatedly and is not being called until its cool-down ends"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"  # let exactly one trial call through
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this opened the breaker"""
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+    def to_dict(self):
+        with self.lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one host"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q: float):
+        with self.lock:
+            if len(self.samples) < 20:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def retry_after_seconds(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(seconds, MAX_RETRY_AFTER))
+
+
+class UpstreamClient:
+    def __init__(self, pool_size=16, timeout=DEFAULT_TIMEOUT, failure_threshold=5, reset_timeout=30.0):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.hedge_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="unchained-hedge")
+
+    def _host_state(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.latencies[host] = LatencyWindow()
+            return self.breakers[host], self.latencies[host]
+
+    def _attempt(self, method, url, host, **kwargs):
+        """One HTTP exchange with breaker bookkeeping and metrics"""
+        breaker, latencies = self._host_state(host)
+        if not breaker.allow():
+            metrics.inc("unchained_upstream_rejected_total", host=host)
+            raise CircuitOpenError(f"circuit open for {host}")
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            elapsed = time.perf_counter() - started
+            metrics.observe("unchained_upstream_request_seconds", elapsed, host=host, outcome="error")
+            metrics.inc("unchained_upstream_errors_total", host=host, error=type(e).__name__)
+            if breaker.record_failure():
+                metrics.inc("unchained_upstream_circuit_opened_total", host=host)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe("unchained_upstream_request_seconds", elapsed, host=host, outcome=str(resp.status_code))
+        metrics.inc("unchained_upstream_requests_total", host=host, status=resp.status_code)
+        if resp.status_code >= 500:
+            if breaker.record_failure():
+                metrics.inc("unchained_upstream_circuit_opened_total", host=host)
+        else:
+            # 4xx (including 429) means the host is up; it is not a reason to trip the breaker
+            breaker.record_success()
+            latencies.add(elapsed)
+        return resp
+
+    def _hedged_attempt(self, method, url, host, hedge_after, **kwargs):
+        if hedge_after == "auto":
+            p95 = self._host_state(host)[1].quantile(0.95)
+            hedge_after = max(MIN_HEDGE_DELAY, p95) if p95 is not None else DEFAULT_HEDGE_DELAY
+        first = self.hedge_pool.submit(self._attempt, method, url, host, **kwargs)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        metrics.inc("unchained_upstream_hedges_total", host=host)
+        second = self.hedge_pool.submit(self._attempt, method, url, host, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                for other in pending:
+                    # The slower copy is dropped once it finishes
+                    other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                if future is second:
+                    metrics.inc("unchained_upstream_hedge_wins_total", host=host)
+                return resp
+        raise error
+
+    def request(self, method, url, *, retries=None, hedge_after=None, idempotent=None, host=None, **kwargs):
+        """Send a request with the shared session, breaker, retries and optional hedging.
+
+        retries defaults to 2 for idempotent calls (GET, HEAD, or idempotent=True)
+        and 0 otherwise. hedge_after is None, a delay in seconds, or "auto" to use
+        the host's recent p95 latency. The last response is returned even if its
+        status is an error, like requests does.
+        """
+        method = method.upper()
+        host = host or urlparse(url).hostname or "unknown"
+        kwargs.setdefault("timeout", self.timeout)
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD")
+        if retries is None:
+            retries = 2 if idempotent else 0
+        attempt = 0
+        while True:
+            try:
+                if hedge_after is not None and idempotent and not kwargs.get("stream"):
+                    resp = self._hedged_attempt(method, url, host, hedge_after, **kwargs)
+                else:
+                    resp = self._attempt(method, url, host, **kwargs)
+            except CircuitOpenError:
+                raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+                delay = None
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp
+                delay = retry_after_seconds(resp)
+                resp.close()
+            if delay is None:
+                delay = min(MAX_RETRY_AFTER, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            metrics.inc("unchained_upstream_retries_total", host=host)
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def status(self):
+        with self.lock:
+            hosts = list(self.breakers)
+        result = {}
+        for host in hosts:
+            breaker, latencies = self._host_state(host)
+            result[host] = {**breaker.to_dict(), "p50": latencies.quantile(0.5), "p95": latencies.quantile(0.95)}
+        return result
+
+
+metrics.describe("unchained_upstream_request_seconds", "histogram", "Latency of single upstream HTTP exchanges by host and outcome")
+metrics.describe("unchained_upstream_errors_total", "counter", "Upstream calls that failed without a response")
+metrics.describe("unchained_upstream_retries_total", "counter", "Upstream calls retried after an error, 429 or 5xx")
+metrics.describe("unchained_upstream_hedges_total", "counter", "Hedged second requests sent")
+metrics.describe("unchained_upstream_hedge_wins_total", "counter", "Hedged second requests that answered first")
+metrics.describe("unchained_upstream_rejected_total", "counter", "Calls refused because the host's circuit was open")
+metrics.describe("unchained_upstream_circuit_opened_total", "counter", "Times a host's circuit breaker opened")
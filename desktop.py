@@ -1,33 +1,66 @@
 import sys 
+import time
+STARTUP_T0 = time.perf_counter()
 VERSION = "0.0.19" 
 # Check for --version argument
 if "--version" in sys.argv:
     print(f"Unchained Launcher version {VERSION}")
     sys.exit(0)
 
+# Heavy modules (webview, uvicorn, backend.main with FastAPI/PIL/requests/rapidfuzz,
+# pystray) are imported lazily so the window can appear before the library scan runs.
 import platform
-import time
 import os
-import webview
 import random
-import uvicorn
+import socket
 import threading
-from backend.main import app
 import logging
-import pystray
-from PIL import Image  
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- CONFIG ---
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
- 
-
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+
+SPLASH_HTML = """
+<html>
+  <body style="margin:0;height:100vh;display:flex;align-items:center;justify-content:center;
+               background:#0e141b;color:#fff;font-family:sans-serif;">
+    <h1 style="font-weight:300;letter-spacing:.2em;opacity:.8">UNCHAINED LAUNCHER</h1>
+  </body>
+</html>
+"""
+
+window = None
 window_hidden = False
 
+server_ready = threading.Event()
+server_error = None
+
+startup_marks = []
+startup_lock = threading.Lock()
+
+def mark_startup(label):
+    """Record a startup milestone for --profile-startup."""
+    with startup_lock:
+        startup_marks.append((label, time.perf_counter()))
+
+def print_startup_profile():
+    """Print the time spent between startup milestones."""
+    with startup_lock:
+        marks = sorted(startup_marks, key=lambda m: m[1])
+    previous = STARTUP_T0
+    print("Startup timing:")
+    for label, at in marks:
+        print(f"  {label:<28} +{(at - previous) * 1000:8.1f} ms  (at {(at - STARTUP_T0) * 1000:8.1f} ms)")
+        previous = at
+
 def create_tray_icon():
     """Create and run the system tray icon."""
+    import pystray
+    from PIL import Image
+
     icon_path = os.path.join(ROOT_DIR, "icon-alt.png")
     if os.path.exists(icon_path):
         image = Image.open(icon_path)
@@ -86,28 +119,83 @@ def get_port_from_env(env_name: str = "PORT", default: int = 8000) -> int:
         logger.warning("Invalid port value %r, using default %s", val, default)
     return default
 
+# PORT is what the window opens (the vite dev server in dev.sh), SERVER_PORT is what uvicorn binds
 PORT = get_port_from_env("PORT", 8000)
-BACKEND_URL = f"http://localhost:{PORT}?nocache={random.randint(0,100000)}"
-
-def run_server():
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+SERVER_PORT = get_port_from_env("SERVER_PORT", PORT)
+# "http" talks to the backend over loopback HTTP; "bridge" routes API calls through
+# pywebview's js_api in-process and only uses HTTP for static assets and images
+TRANSPORT = os.getenv("UNCHAINED_TRANSPORT", "http")
+BACKEND_URL = f"http://localhost:{PORT}?nocache={random.randint(0,100000)}&transport={TRANSPORT}"
+
+def bind_server_socket(port: int) -> socket.socket:
+    """Bind and listen before the backend is imported so early connections queue instead of failing."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # LAN peers need to reach the server; the backend only answers the peer sharing
+    # endpoints for non-loopback clients, so the control API stays local
+    host = "0.0.0.0" if os.getenv("UNCHAINED_PEERS") == "1" else "127.0.0.1"
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+def run_server(sock: socket.socket):
+    """Import the backend and serve it on the pre-bound socket, signalling readiness once started."""
+    global server_error
+    try:
+        import uvicorn
+        mark_startup("uvicorn imported")
+        from backend.main import app
+        mark_startup("backend imported + scanned")
+
+        class ReadyServer(uvicorn.Server):
+            async def startup(self, sockets=None):
+                await super().startup(sockets=sockets)
+                mark_startup("server accepting")
+                server_ready.set()
+
+        ReadyServer(uvicorn.Config(app)).run(sockets=[sock])
+    except Exception as e:
+        logger.exception("Backend failed to start")
+        server_error = e
+        server_ready.set()
+
+def load_when_ready():
+    """Runs once the GUI loop is up: swap the splash for the app when the server is ready."""
+    mark_startup("window shown")
+    server_ready.wait()
+    if server_error is not None:
+        window.load_html(f"<body style='background:#0e141b;color:#fff'><pre>Backend failed to start: {server_error}</pre></body>")
+        return
+    window.load_url(BACKEND_URL)
+    mark_startup("app url loaded")
+    if PROFILE_STARTUP:
+        print_startup_profile()
 
 def main():
     global window
 
+    # Bind first and start importing the backend in parallel with the GUI
+    sock = bind_server_socket(SERVER_PORT)
+    os.environ.setdefault("UNCHAINED_PORT", str(SERVER_PORT))
+    mark_startup("socket bound")
+    server_thread = threading.Thread(target=run_server, args=(sock,), daemon=True)
+    server_thread.start()
+
+    import webview
+    mark_startup("webview imported")
 
+    js_api = None
+    if TRANSPORT == "bridge":
+        from backend.bridge import Bridge
+        js_api = Bridge()
 
-    window = webview.create_window("Unchained Launcher", BACKEND_URL)
+    window = webview.create_window("Unchained Launcher", html=SPLASH_HTML, js_api=js_api)
 
     # Start system tray in a separate thread
     tray_thread = threading.Thread(target=create_tray_icon, daemon=True)
     tray_thread.start()
 
-    # Start the FastAPI server in a separate thread
-    server_thread = threading.Thread(target=run_server, daemon=True)
-    server_thread.start()
-    
-
     # WebKit settings
     os.environ["WEBKIT_DISABLE_COMPOSITING_MODE"] = "0"
     os.environ["WEBKIT_USE_ACCELERATED_COMPOSITING"] = "1"
@@ -115,8 +203,6 @@ def main():
     # QT / QtWebEngine (if using qt backend)
     os.environ["QTWEBENGINE_CHROMIUM_FLAGS"] = "--enable-gpu-rasterization --ignore-gpu-blacklist"
 
-    # Create webview window
-
     gui_backend = "cef"   # CEF on Linux/macOS
     
     if platform.system() == "Windows":
@@ -127,7 +213,7 @@ def main():
         debug = True
 
     # Start webview GUI
-    webview.start(gui=gui_backend,debug=debug)  # Set debug to False for production
+    webview.start(load_when_ready, gui=gui_backend, debug=debug)  # Set debug to False for production
 
 if __name__ == "__main__":
     main()
@@ -18,6 +18,20 @@ a = Analysis(
         'webview.platforms.cocoa',
         'uvicorn',
         'backend.main',
+        'backend.metrics',
+        'backend.bridge',
+        'backend.prefetch',
+        'backend.governor',
+        'backend.downloads',
+        'backend.installer',
+        'backend.peers',
+        'backend.manifests',
+        'backend.libraries',
+        'backend.snapshot',
+        'backend.catalog',
+        'backend.upstream',
+        'backend.store',
+        'backend.jobs',
         'fastapi',
         'starlette',
         'pydantic',
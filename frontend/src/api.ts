@@ -1,19 +1,45 @@
 import axios from "axios";
-import { type AllSearchGamesType, type GameInfo } from "./types";
+import { type AllSearchGamesType, type DownloadEntry, type GameInfo } from "./types";
 
 export const API_URL = "/api";
 
+type BridgeApi = Record<string, (...args: unknown[]) => Promise<any>>;
+
+declare global {
+  interface Window {
+    pywebview?: { api: BridgeApi };
+  }
+}
+
+// desktop.py appends ?transport=bridge when API calls should go through pywebview's js_api
+const TRANSPORT_KEY = "unchained-transport";
+const transportParam = new URLSearchParams(window.location.search).get("transport");
+if (transportParam) {
+  sessionStorage.setItem(TRANSPORT_KEY, transportParam);
+}
+const useBridge = sessionStorage.getItem(TRANSPORT_KEY) === "bridge";
+
+const bridge = async (): Promise<BridgeApi> => {
+  if (!window.pywebview?.api) {
+    await new Promise((resolve) => window.addEventListener("pywebviewready", resolve, { once: true }));
+  }
+  return window.pywebview!.api;
+};
+
 export const fetchGames = async (): Promise<GameInfo[]> => {
+  if (useBridge) return (await bridge()).list_games();
   const res = await axios.get<GameInfo[]>(`${API_URL}/library`);
   return res.data;
 };
 
 export const searchGames = async (query: string, category: string = "all"): Promise<AllSearchGamesType> => {
+  if (useBridge) return (await bridge()).search_games(query, category);
   const res = await axios.post(`${API_URL}/search`, { query, category });
   return res.data;
 };
 
 export const launchGame = async (gameId: number) => {
+  if (useBridge) return (await bridge()).launch_game(gameId);
   const res = await axios.get(
     `${API_URL}/games/${gameId}/launch`,
   );
@@ -21,11 +47,31 @@ export const launchGame = async (gameId: number) => {
 };
 
 export const refreshGames = async () => {
+  if (useBridge) return (await bridge()).refresh_games();
   const res = await axios.post(`${API_URL}/refresh`);
   return res.data;
 };
 
+export const startDownload = async (entry: DownloadEntry) => {
+  const res = await axios.post(`${API_URL}/downloads`, { title: entry.title, uris: entry.uris });
+  return res.data;
+};
+
+export type PrefetchHint =
+  | { kind: "game"; game_id: number; category?: string }
+  | { kind: "query"; query: string };
+
+// Fire-and-forget: tells the backend what is likely to be opened next so it can warm caches
+export const sendPrefetchHint = (hint: PrefetchHint) => {
+  axios.post(`${API_URL}/prefetch/hint`, hint).catch(() => { });
+};
+
+// Remote IGDB artwork goes through the backend image cache, which prefetching warms
+export const cachedImageUrl = (url?: string) =>
+  url?.startsWith("http") ? `${API_URL}/image?url=${encodeURIComponent(url)}` : url;
+
 export const getIgdbGameMetadata = async (game_id: string): Promise<GameInfo> => {
+  if (useBridge) return (await bridge()).get_igdb_game_metadata(game_id);
   const res = await axios.get(`${API_URL}/game/igdb/${game_id}`)
   return res.data
 
@@ -1,6 +1,6 @@
 import { useCallback, useEffect, useMemo, useRef, useState, type RefObject } from "react";
 import { type GameInfo } from "../types";
-import { API_URL } from "../api";
+import { API_URL, sendPrefetchHint } from "../api";
 import { LucideDownload, LucidePlay } from "lucide-react";
 import { useImageCache } from "../hooks/useImageCache";
 import { LazyLoadImage } from 'react-lazy-load-image-component';
@@ -166,6 +166,12 @@ const GameCard: React.FC<Props> = ({ index, game, big, last, hideGameInfo, hideG
     return () => clearInterval(interval);
   }, [selected]);
 
+  useEffect(() => {
+    if (selected) {
+      sendPrefetchHint({ kind: "game", game_id: game.category == "library" ? (game?.metadata?.id || game.id) : game.id, category: game.category });
+    }
+  }, [selected, game]);
+
   const openGamePage = useCallback(() => {
     navigate(`/game/` + (game.category == "library" ? (game?.metadata?.id || game.id) : game.id))
   }, [game])
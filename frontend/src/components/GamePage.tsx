@@ -2,7 +2,7 @@ import React, { useCallback, useEffect, useRef } from 'react';
 import { useLoaderData } from 'react-router-dom';
 import type { GameInfo } from '../types';
 import { ChevronDown, LucideDownload, LucidePlay } from 'lucide-react';
-import { API_URL, launchGame } from '../api';
+import { API_URL, cachedImageUrl, launchGame, startDownload } from '../api';
 import FocusableItem, { type FocusableItemHandle } from './FocusableItem';
 
 const InstallButton = ({ installed, game }: { installed?: boolean, game: GameInfo }) => {
@@ -12,7 +12,12 @@ const InstallButton = ({ installed, game }: { installed?: boolean, game: GameInf
   const { id } = game
 
   const installGame = useCallback(() => {
-    alert(JSON.stringify(game.downloads))
+    const entry = game.downloads?.[0]
+    if (!entry) {
+      alert("No downloads available for this game")
+      return
+    }
+    startDownload(entry)
   }, [game])
 
   useEffect(() => {
@@ -56,7 +61,7 @@ const GamePage: React.FC = () => {
   const installed = game.category == "library"
 
   const artworks = installed ? game.metadata?.artworks : game.artworks
-  const artwork = (installed ? API_URL : "") + artworks?.[artworks?.length - 1]
+  const artwork = installed ? API_URL + artworks?.[artworks?.length - 1] : cachedImageUrl(artworks?.[artworks?.length - 1])
 
   return (
     <>
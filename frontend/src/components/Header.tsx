@@ -3,6 +3,7 @@ import Clock from "./Clock"
 import { useCallback, useEffect, useRef, useState } from "react";
 import { useLocation, useNavigate, useSearchParams } from "react-router-dom";
 import FocusableItem from "./FocusableItem";
+import { sendPrefetchHint } from "../api";
 
 export default function Header() {
 
@@ -94,6 +95,9 @@ export default function Header() {
   const handleInputChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setInputValue(e.target.value);
     setQuery(query)
+    if (e.target.value) {
+      sendPrefetchHint({ kind: "query", query: e.target.value });
+    }
     //navigate(`/search?q=${encodeURIComponent(query)}`);
   };
 
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend import downloads
+from backend.downloads import DownloadManager, _pack_bitmap
+
+CHUNK = 64 * 1024
+DATA = bytes(range(256)) * (CHUNK * 5 // 256 + 7)  # five full chunks and a partial one
+
+
+@pytest.fixture
+def server():
+    """Local stand-in for a mirror; records every request and can drop range support"""
+    state = {"ranges": True, "requests": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _headers(self, status, length, extra=()):
+            self.send_response(status)
+            self.send_header("Content-Length", str(length))
+            if state["ranges"]:
+                self.send_header("Accept-Ranges", "bytes")
+            for name, value in extra:
+                self.send_header(name, value)
+            self.end_headers()
+
+        def do_HEAD(self):
+            state["requests"].append(("HEAD", None))
+            self._headers(200, len(DATA))
+
+        def do_GET(self):
+            requested = self.headers.get("Range")
+            state["requests"].append(("GET", requested))
+            if requested and state["ranges"]:
+                start, end = (int(x) for x in requested.split("=", 1)[1].split("-"))
+                body = DATA[start:end + 1]
+                self._headers(206, len(body), [("Content-Range", f"bytes {start}-{end}/{len(DATA)}")])
+            else:
+                body = DATA
+                self._headers(200, len(body))
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{httpd.server_address[1]}/game.zip"
+    yield state
+    httpd.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(downloads, "CHUNK_SIZE", CHUNK)
+
+
+def wait_finished(download, timeout=10):
+    deadline = time.monotonic() + timeout
+    while download.status not in ("completed", "failed") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return download.status
+
+
+def test_resumes_missing_chunks_from_bitmap(server, tmp_path):
+    num_chunks = (len(DATA) + CHUNK - 1) // CHUNK
+    bitmap = bytearray(num_chunks)
+    part = bytearray(len(DATA))
+    for index in (0, 1, 3):
+        bitmap[index] = 1
+        part[index * CHUNK:(index + 1) * CHUNK] = DATA[index * CHUNK:(index + 1) * CHUNK]
+    (tmp_path / "game.zip.part").write_bytes(part)
+    (tmp_path / ".state").mkdir()
+    (tmp_path / ".state" / "abc.json").write_text(json.dumps({
+        "id": "abc", "title": "game.zip", "uris": [server["url"]], "path": str(tmp_path / "game.zip"),
+        "checksum": "sha256:" + hashlib.sha256(DATA).hexdigest(), "size": len(DATA), "ranges": True,
+        "chunk_size": CHUNK, "bitmap": _pack_bitmap(bitmap), "num_chunks": num_chunks, "status": "downloading",
+    }))
+
+    manager = DownloadManager(tmp_path)
+    manager.load()
+
+    assert wait_finished(manager.get("abc")) == "completed"
+    assert (tmp_path / "game.zip").read_bytes() == DATA
+    fetched = sorted(int(r.split("=")[1].split("-")[0]) // CHUNK for method, r in server["requests"] if method == "GET")
+    assert fetched == [i for i in range(num_chunks) if not bitmap[i]]
+
+
+def test_falls_back_to_one_stream_without_range_support(server, tmp_path):
+    server["ranges"] = False
+    manager = DownloadManager(tmp_path)
+
+    download = manager.add([server["url"]])
+
+    assert wait_finished(download) == "completed"
+    assert download.path.read_bytes() == DATA
+    assert [r for method, r in server["requests"] if method == "GET"] == [None]
+
+
+def test_checksum_mismatch_fails_and_keeps_no_file(server, tmp_path):
+    manager = DownloadManager(tmp_path)
+
+    download = manager.add([server["url"]], checksum="sha256:" + "0" * 64)
+
+    assert wait_finished(download) == "failed"
+    assert "Checksum mismatch" in download.error
+    assert not download.path.exists()
+    assert not any(download.bitmap)  # the next resume starts over
+
+
+def test_same_filename_gets_separate_paths(server, tmp_path):
+    manager = DownloadManager(tmp_path)
+
+    first = manager.add([server["url"]])
+    second = manager.add([server["url"]])
+
+    assert first.path != second.path
+    assert wait_finished(first) == wait_finished(second) == "completed"
+    assert first.path.read_bytes() == second.path.read_bytes() == DATA
@@ -0,0 +1,81 @@
+import io
+import json
+import time
+import zipfile
+
+from backend.downloads import DownloadManager
+from backend.installer import Installer
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def completed_download(tmp_path, data, ranges):
+    """Persist a finished download the way a previous run would have left it"""
+    downloads_dir = tmp_path / "downloads"
+    (downloads_dir / ".state").mkdir(parents=True)
+    (downloads_dir / "Game.zip").write_bytes(data)
+    (downloads_dir / ".state" / "abc.json").write_text(json.dumps({
+        "id": "abc", "title": "Game.zip", "uris": ["http://127.0.0.1:9/Game.zip"],
+        "path": str(downloads_dir / "Game.zip"), "size": len(data), "ranges": ranges,
+        "chunk_size": len(data), "bitmap": "AQ==", "num_chunks": 1, "status": "completed",
+    }))
+    manager = DownloadManager(downloads_dir)
+    manager.load()
+    return manager
+
+
+def make_installer(tmp_path, manager, on_installed):
+    (tmp_path / "data").mkdir()
+    return Installer(tmp_path / "staging", tmp_path / "data", manager.state_dir / "installs", on_installed)
+
+
+def wait_installed(installer, install_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while installer.get(install_id).status not in ("installed", "no_executable", "failed") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return installer.get(install_id)
+
+
+def test_pending_install_of_reloaded_download_completes(tmp_path):
+    manager = completed_download(tmp_path, make_zip({"Game/Game.exe": b"MZ" * 1000, "Game/data.bin": b"x" * 5000}), ranges=False)
+    installed = []
+    installer = make_installer(tmp_path, manager, installed.append)
+    (manager.state_dir / "installs" / "abc.json").write_text(json.dumps({"name": "Game", "download_id": "abc"}))
+
+    installer.load(manager.get)
+    install = wait_installed(installer, "abc")
+
+    assert install.status == "installed", install.error
+    assert (tmp_path / "data" / "Game" / "data.bin").read_bytes() == b"x" * 5000
+    assert installed == [install]
+    assert not (manager.state_dir / "installs" / "abc.json").exists()
+
+
+def test_library_hook_failure_leaves_game_installed(tmp_path):
+    manager = completed_download(tmp_path, make_zip({"Game/Game.exe": b"MZ"}), ranges=True)
+
+    def fail(install):
+        raise RuntimeError("library busy")
+
+    installer = make_installer(tmp_path, manager, fail)
+    install = wait_installed(installer, installer.start(manager.get("abc"), name="Game").id)
+
+    assert install.status == "installed"
+    assert (tmp_path / "data" / "Game" / "Game.exe").exists()
+
+
+def test_game_without_executable_is_not_reported(tmp_path):
+    manager = completed_download(tmp_path, make_zip({"Game/readme.txt": b"hi"}), ranges=True)
+    installed = []
+    installer = make_installer(tmp_path, manager, installed.append)
+
+    install = wait_installed(installer, installer.start(manager.get("abc"), name="Game").id)
+
+    assert install.status == "no_executable"
+    assert installed == []
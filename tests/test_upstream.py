@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from backend import fault_server
+from backend.upstream import CircuitOpenError, UpstreamClient
+
+NO_FAULTS = ["--port", "0", "--latency-ms", "0", "--slow-rate", "0", "--error-rate", "0",
+             "--rate-limit-rate", "0", "--hang-rate", "0", "--reset-rate", "0"]
+
+
+@pytest.fixture
+def upstream():
+    """The fault server on a free port with every fault off; tests turn them on through options"""
+    options = fault_server.parse_options(NO_FAULTS)
+    stats = {}
+    server = fault_server.make_server(options, stats)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield options, stats, f"http://127.0.0.1:{server.server_address[1]}/image.png"
+    server.shutdown()
+
+
+def test_breaker_opens_and_lets_one_trial_through(upstream):
+    options, stats, url = upstream
+    client = UpstreamClient(failure_threshold=3, reset_timeout=0.3)
+    options.error_rate = 1
+
+    for _ in range(3):
+        assert client.get(url, retries=0).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        client.get(url, retries=0)
+    assert stats == {"error": 3}
+
+    time.sleep(0.35)
+    options.error_rate, options.slow_rate, options.slow_ms = 0, 1, 300
+    trial = {}
+    thread = threading.Thread(target=lambda: trial.update(resp=client.get(url, retries=0)))
+    thread.start()
+    time.sleep(0.1)
+    with pytest.raises(CircuitOpenError):
+        client.get(url, retries=0)  # the trial is still in flight
+    thread.join()
+
+    assert trial["resp"].status_code == 200
+    assert stats == {"error": 3, "slow": 1}
+    assert client.status()["127.0.0.1"]["state"] == "closed"
+
+
+def test_rate_limited_call_waits_for_retry_after(upstream):
+    options, stats, url = upstream
+    client = UpstreamClient()
+    options.rate_limit_rate = 1
+
+    started = time.monotonic()
+    resp = client.get(url, retries=1)
+
+    assert resp.status_code == 429
+    assert time.monotonic() - started >= 0.9  # the fault server sends Retry-After: 1
+    assert stats == {"rate_limited": 2}
+    assert client.status()["127.0.0.1"]["state"] == "closed"  # 429 means the host is up
+
+
+def test_hedge_fires_after_delay(upstream):
+    options, stats, url = upstream
+    client = UpstreamClient()
+
+    assert client.get(url, hedge_after=0.2).status_code == 200
+    assert stats == {"ok": 1}  # answered before the delay, so no second request
+
+    options.slow_rate, options.slow_ms = 1, 2000
+    result = {}
+    started = time.monotonic()
+    thread = threading.Thread(target=lambda: result.update(resp=client.get(url, hedge_after=0.2)))
+    thread.start()
+    time.sleep(0.1)
+    options.slow_rate = 0  # the hedged copy is answered at once
+    thread.join()
+    elapsed = time.monotonic() - started
+
+    assert result["resp"].status_code == 200
+    assert 0.2 <= elapsed < 1.5
+    assert stats == {"ok": 2}  # the slow first copy is still sleeping and is counted when it answers